@@ -1,56 +1,272 @@
+import functools
 import json
 import os
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Protocol
 
-import boto3
-import hyp3_sdk
+import aws
+import job_snapshot
+import ledger
+import metrics
+import ratelimit
+import util
 
-import gunw
-import opera_rtc_s1_slc
 
+if TYPE_CHECKING:
+    import hyp3_sdk
+    import requests
 
-def get_job_dict(hyp3_url: str, username: str, password: str, job_id: str) -> dict:
+
+DEFAULT_CREDENTIALS_TTL_SECONDS = 15 * 60
+DEFAULT_HYP3_RATE_LIMIT = 5.0
+DEFAULT_HYP3_MAX_RATE_LIMIT = 20.0
+DEFAULT_HYP3_MAX_RETRIES = 3
+DEFAULT_RECORD_TIME_ESTIMATE_SECONDS = 60.0
+DEFAULT_DEADLINE_MARGIN_SECONDS = 10.0
+CREDENTIALS_CACHE: dict = {}
+CREDENTIALS_LOCK = threading.Lock()
+
+HYP3_CLIENTS: dict[str, tuple[tuple[str, str], 'hyp3_sdk.HyP3']] = {}
+HYP3_CLIENTS_LOCK = threading.Lock()
+
+
+class LambdaContext(Protocol):
+    def get_remaining_time_in_millis(self) -> int: ...
+
+
+def get_hyp3_client(hyp3_url: str, username: str, password: str, refresh: bool = False) -> 'hyp3_sdk.HyP3':
+    import hyp3_sdk
+
+    with HYP3_CLIENTS_LOCK:
+        cached = HYP3_CLIENTS.get(hyp3_url)
+    if not refresh and cached is not None and cached[0] == (username, password):
+        return cached[1]
+
+    # Logging in is a network round trip, so it happens outside the lock to not hold up workers using other clients.
     hyp3 = hyp3_sdk.HyP3(hyp3_url, username, password)
-    job = hyp3.get_job_by_id(job_id)
+    with HYP3_CLIENTS_LOCK:
+        HYP3_CLIENTS[hyp3_url] = ((username, password), hyp3)
+    return hyp3
+
+
+def _get_response(error: 'hyp3_sdk.exceptions.HyP3Error') -> 'requests.Response | None':
+    # hyp3_sdk raises its errors while handling the requests.HTTPError that carries the response.
+    return getattr(error.__context__, 'response', None)
+
+
+def _is_unauthorized(error: 'hyp3_sdk.exceptions.HyP3Error') -> bool:
+    return (response := _get_response(error)) is not None and response.status_code in (401, 403)
+
+
+def _get_retry_after(error: 'hyp3_sdk.exceptions.HyP3Error') -> float | None:
+    response = _get_response(error)
+    return None if response is None else ratelimit.parse_retry_after(response.headers.get('Retry-After'))
+
+
+def _is_throttled(error: 'hyp3_sdk.exceptions.HyP3Error') -> bool:
+    return (response := _get_response(error)) is not None and response.status_code == 429
+
+
+def get_hyp3_rate_limiter(hyp3_url: str) -> ratelimit.AdaptiveRateLimiter:
+    return ratelimit.get_rate_limiter(
+        hyp3_url,
+        float(os.environ.get('HYP3_RATE_LIMIT', DEFAULT_HYP3_RATE_LIMIT)),
+        float(os.environ.get('HYP3_MAX_RATE_LIMIT', DEFAULT_HYP3_MAX_RATE_LIMIT)),
+    )
+
+
+def _get_job_by_id(hyp3: 'hyp3_sdk.HyP3', rate_limiter: ratelimit.AdaptiveRateLimiter, job_id: str) -> 'hyp3_sdk.Job':
+    import hyp3_sdk
+
+    max_retries = int(os.environ.get('HYP3_MAX_RETRIES', DEFAULT_HYP3_MAX_RETRIES))
+    retries = 0
+    while True:
+        # Waits out any Retry-After the HyP3 API asked for before each attempt.
+        rate_limiter.acquire()
+        try:
+            job = hyp3.get_job_by_id(job_id)
+        except hyp3_sdk.exceptions.HyP3Error as e:
+            if not _is_throttled(e):
+                raise
+            rate_limiter.on_throttle(_get_retry_after(e))
+            if retries >= max_retries:
+                raise
+            retries += 1
+            print(f'HyP3 throttled the request for job {job_id}, retrying ({retries}/{max_retries})')
+            continue
+        rate_limiter.on_success()
+        return job
+
+
+def get_job_dict(hyp3_url: str, username: str, password: str, job_id: str) -> dict:
+    import hyp3_sdk
+
+    rate_limiter = get_hyp3_rate_limiter(hyp3_url)
+    hyp3 = get_hyp3_client(hyp3_url, username, password)
+    try:
+        job = _get_job_by_id(hyp3, rate_limiter, job_id)
+    except hyp3_sdk.exceptions.HyP3Error as e:
+        if not _is_unauthorized(e):
+            raise
+        print(f'HyP3 session for {hyp3_url} is no longer authorized, logging in again')
+        job = _get_job_by_id(get_hyp3_client(hyp3_url, username, password, refresh=True), rate_limiter, job_id)
     return job.to_dict()
 
 
-def process_message(message: dict, edl_credentials: dict) -> None:
-    username, password = edl_credentials['username'], edl_credentials['password']
+def get_job_from_snapshot(message: dict, key: str | None) -> dict | None:
+    if (snapshot := message.get('job_snapshot')) is None:
+        return None
+
+    # The snapshot decides which user and bucket a job's outputs are ingested for, so it is only trusted when it was
+    # signed with the key shared with the plugin.
+    if not key:
+        print(f'Ignoring job snapshot for {message["job_id"]} because no job snapshot key is configured')
+        return None
+
+    if snapshot.get('version') != job_snapshot.VERSION:
+        print(f'Ignoring job snapshot with unsupported version {snapshot.get("version")}')
+        return None
+
+    if not job_snapshot.is_signed(snapshot, key):
+        print(f'Ignoring job snapshot for {message["job_id"]} because its signature does not match')
+        return None
+
+    job = snapshot['job']
+    if job.get('job_id') != message['job_id'] or any(not job.get(field) for field in job_snapshot.FIELDS):
+        print(f'Ignoring stale or incomplete job snapshot for {message["job_id"]}')
+        return None
+
+    return job
+
+
+def process_message(message: dict, edl_credentials: dict, publish: aws.Publish) -> None:
     hyp3_url = message['hyp3_url']
-    job = get_job_dict(hyp3_url, username, password, message['job_id'])
+    job = get_job_from_snapshot(message, edl_credentials.get('job_snapshot_key'))
+    if job is None:
+        username, password = edl_credentials['username'], edl_credentials['password']
+        with metrics.timed('hyp3_fetch'):
+            job = get_job_dict(hyp3_url, username, password, message['job_id'])
+    process_job(job, hyp3_url, publish)
+
 
+def process_job(job: dict, hyp3_url: str, publish: aws.Publish) -> None:
+    metrics.set_dimensions(job_type=job['job_type'])
+
+    # Job type modules are only imported once a job of that type is processed, to keep cold starts short.
     match job['job_type']:
         case 'ARIA_S1_GUNW' | 'INSAR_ISCE' | 'ARIA_RAIDER':
-            gunw.process_job(job, hyp3_url)
+            import gunw
+
+            gunw.process_job(job, hyp3_url, publish)
         case 'OPERA_RTC_S1_SLC':
-            opera_rtc_s1_slc.process_job(job)
+            import opera_rtc_s1_slc
+
+            opera_rtc_s1_slc.process_job(job, publish)
         case _:
             raise ValueError(f'Job type {job["job_type"]} is not supported')
 
 
-def load_credentials() -> dict:
-    secret_arn = os.environ['SECRET_ARN']
-    secretsmanager = boto3.client('secretsmanager')
+def load_credentials(force_refresh: bool = False) -> dict:
+    with CREDENTIALS_LOCK:
+        if not force_refresh and CREDENTIALS_CACHE and time.monotonic() < CREDENTIALS_CACHE['expires_at']:
+            return CREDENTIALS_CACHE['credentials']
 
-    response = secretsmanager.get_secret_value(SecretId=secret_arn)
-    credentials = json.loads(response['SecretString'])
+        secret_arn = os.environ['SECRET_ARN']
+        secretsmanager = util.create_boto3_client('secretsmanager')
 
-    return credentials
+        response = secretsmanager.get_secret_value(SecretId=secret_arn)
+        credentials = json.loads(response['SecretString'])
 
+        ttl_seconds = float(os.environ.get('CREDENTIALS_TTL', DEFAULT_CREDENTIALS_TTL_SECONDS))
+        CREDENTIALS_CACHE.update(credentials=credentials, expires_at=time.monotonic() + ttl_seconds)
+
+        return credentials
+
+
+@functools.cache
+def parse_time_estimates(estimates: str) -> dict[str, float]:
+    # Parsed once per value rather than for every record, and a bad value must not fail the whole batch.
+    try:
+        return {job_type: float(seconds) for job_type, seconds in json.loads(estimates).items()}
+    except (AttributeError, TypeError, ValueError):
+        print(f'Ignoring invalid RECORD_TIME_ESTIMATES {estimates!r}')
+        return {}
 
-def lambda_handler(event: dict, _) -> dict:
-    batch_item_failures = []
 
-    credentials = load_credentials()
+def get_time_estimate(record: dict) -> float:
+    estimates = parse_time_estimates(os.environ.get('RECORD_TIME_ESTIMATES', '{}'))
+    # The job type is only known before a record is started if the plugin sent a job snapshot.
+    try:
+        job_type = json.loads(json.loads(record['body'])['Message'])['job_snapshot']['job']['job_type']
+    except (KeyError, TypeError, ValueError):
+        job_type = None
+    return float(estimates.get(job_type, os.environ.get('RECORD_TIME_ESTIMATE', DEFAULT_RECORD_TIME_ESTIMATE_SECONDS)))
 
-    for record in event['Records']:
+
+def process_record(record: dict, publisher: aws.IngestMessagePublisher, deadline: float | None = None) -> bool:
+    # A record that is not started is returned to the queue on its own, whereas timing out would redeliver the whole
+    # batch, including the records that were already processed.
+    if deadline is not None and deadline - time.monotonic() < get_time_estimate(record):
+        print(f'Not enough time left to process message {record["messageId"]}, returning it to the queue')
+        return False
+
+    with metrics.spans():
         try:
             body = json.loads(record['body'])
             message = json.loads(body['Message'])
-            process_message(message, credentials)
+            publish = functools.partial(publisher.publish, tag=record['messageId'])
+            with ledger.delivery(body.get('MessageId')):
+                try:
+                    with metrics.timed('credentials'):
+                        credentials = load_credentials()
+                    process_message(message, credentials, publish)
+                except Exception as e:
+                    import hyp3_sdk
+
+                    if not isinstance(e, hyp3_sdk.exceptions.AuthenticationError):
+                        raise
+                    print('Could not authenticate with cached credentials, reloading them from Secrets Manager')
+                    with metrics.timed('credentials'):
+                        credentials = load_credentials(force_refresh=True)
+                    process_message(message, credentials, publish)
         except Exception:
-            print(traceback.format_exc())
-            print(f'Could not process message {record["messageId"]}')
+            # Print the traceback and message together so that output from concurrent records does not interleave.
+            print(f'{traceback.format_exc()}Could not process message {record["messageId"]}')
+            publisher.discard(record['messageId'])
+            return False
+
+        # Sending each record's messages as soon as it completes leaves nothing but the last record's messages to send
+        # once the deadline is near.
+        if publisher.flush(record['messageId']):
+            print(f'Could not publish all ingest messages for message {record["messageId"]}')
+            return False
+    return True
+
+
+def process_records(
+    records: list[dict], publisher: aws.IngestMessagePublisher, deadline: float | None = None
+) -> list[bool]:
+    with ThreadPoolExecutor(max_workers=util.get_max_record_workers()) as executor:
+        return list(executor.map(lambda record: process_record(record, publisher, deadline), records))
+
+
+def lambda_handler(event: dict, context: LambdaContext | None) -> dict:
+    batch_item_failures = []
+
+    deadline = None
+    if context is not None:
+        # Time reserved for sending the messages of the last records to finish and returning the response.
+        margin = float(os.environ.get('DEADLINE_MARGIN_SECONDS', DEFAULT_DEADLINE_MARGIN_SECONDS))
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin
+    publisher = aws.IngestMessagePublisher()
+
+    processed = process_records(event['Records'], publisher, deadline)
+
+    for record, success in zip(event['Records'], processed, strict=True):
+        if not success:
             batch_item_failures.append({'itemIdentifier': record['messageId']})
+
     return {'batchItemFailures': batch_item_failures}
@@ -1,31 +1,317 @@
+import base64
+import functools
 import hashlib
 import json
+import os
+import random
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Protocol
 
-import boto3
-
+import checksum_cache
 import ingest_message
+import metrics
+import util
+
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+ONE_MB = 1024 * 1024
+MAX_HASH_WORKERS = 4
+
+SQS_MAX_BATCH_ENTRIES = 10
+SQS_MAX_BATCH_BYTES = 256 * 1024
+SQS_MAX_SEND_ATTEMPTS = 3
+SQS_BACKOFF_BASE_SECONDS = 0.2
+
+# Oversized messages are replaced with a pointer in the format of the Amazon SQS Extended Client Library, so that its
+# consumers can fetch the payload from S3 transparently.
+PAYLOAD_S3_POINTER_CLASS = 'software.amazon.payloadoffloading.PayloadS3Pointer'
+EXTENDED_PAYLOAD_SIZE_ATTRIBUTE = 'ExtendedPayloadSize'
+
+MD5_PATTERN = re.compile('[0-9a-f]{32}')
+NATIVE_CHECKSUM_TYPES = {'ChecksumSHA256': 'sha256', 'ChecksumSHA1': 'sha1'}
+
+
+# boto3 takes a few hundred milliseconds to import, so clients are created the first time they are needed.
+@functools.cache
+def get_s3_client() -> 'BaseClient':
+    from botocore.config import Config
+
+    # Every record worker can download up to MAX_HASH_WORKERS objects at once.
+    max_pool_connections = util.get_max_record_workers() * MAX_HASH_WORKERS
+    return util.create_boto3_client('s3', config=Config(max_pool_connections=max_pool_connections))
+
+
+@functools.cache
+def get_sqs_client() -> 'BaseClient':
+    return util.create_boto3_client('sqs')
+
+
+def __getattr__(name: str) -> 'BaseClient':
+    if name == 'S3_CLIENT':
+        return get_s3_client()
+    if name == 'SQS_CLIENT':
+        return get_sqs_client()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
 
+@dataclass(frozen=True)
+class Checksum:
+    value: str
+    type: str
 
-ONE_KB = 1024 * 1024
-S3_CLIENT = boto3.client('s3')
-SQS_CLIENT = boto3.client('sqs')
 
+@dataclass(frozen=True, slots=True)
+class S3Object:
+    key: str
+    size: int
+    etag: str
 
-def md5_for_s3_file(bucket: str, key: str, chunk_size: int = ONE_KB) -> str:
-    response = S3_CLIENT.get_object(Bucket=bucket, Key=key)
+
+def get_hash_chunk_size() -> int:
+    return int(os.environ.get('HASH_CHUNK_SIZE', ONE_MB))
+
+
+def md5_for_s3_file(bucket: str, key: str, chunk_size: int | None = None) -> str:
+    response = get_s3_client().get_object(Bucket=bucket, Key=key)
 
     md5_hash = hashlib.md5()
 
-    for chunk in response['Body'].iter_chunks(chunk_size):
+    for chunk in response['Body'].iter_chunks(chunk_size or get_hash_chunk_size()):
         md5_hash.update(chunk)
 
     return md5_hash.hexdigest()
 
 
-def list_objects_for_job(bucket: str, job_id: str) -> dict:
-    return S3_CLIENT.list_objects_v2(Bucket=bucket, Prefix=job_id)
+def _md5_from_etag(etag: str) -> str | None:
+    # The ETag of an object uploaded in a single part without SSE-KMS or SSE-C is the MD5 of its content.
+    # Multipart ETags look like "<hex>-<number of parts>" and never match.
+    etag = etag.strip('"')
+    return etag if MD5_PATTERN.fullmatch(etag) else None
+
+
+def _native_checksum(head_object_response: dict) -> Checksum | None:
+    # Composite checksums of multipart uploads are checksums of the part checksums, not of the object.
+    if head_object_response.get('ChecksumType', 'FULL_OBJECT') != 'FULL_OBJECT':
+        return None
+    for field, checksum_type in NATIVE_CHECKSUM_TYPES.items():
+        if (value := head_object_response.get(field)) and '-' not in value:
+            return Checksum(base64.b64decode(value).hex(), checksum_type)
+    return None
+
+
+def _resolve_checksum(bucket: str, key: str) -> Checksum:
+    response = get_s3_client().head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+
+    encrypted = response.get('ServerSideEncryption', '').startswith('aws:kms') or 'SSECustomerAlgorithm' in response
+    if not encrypted and (md5 := _md5_from_etag(response['ETag'])):
+        return Checksum(md5, 'md5')
+
+    if checksum := _native_checksum(response):
+        return checksum
+
+    return Checksum(md5_for_s3_file(bucket, key), 'md5')
+
+
+def get_checksum(bucket: str, key: str, etag: str | None = None, size: int | None = None) -> Checksum:
+    # ListObjectsV2 does not report how an object is encrypted, so a listed ETag is only used as a cache key and is not
+    # trusted as an MD5 until HeadObject has shown that the object is not encrypted with SSE-KMS or SSE-C.
+    if etag is None or size is None:
+        return _resolve_checksum(bucket, key)
+
+    # The cache only saves work, so a throttled table or a locked database should not fail the record.
+    try:
+        cache = checksum_cache.get_checksum_cache()
+    except Exception:
+        print(f'{traceback.format_exc()}Could not open the checksum cache for s3://{bucket}/{key}')
+        return _resolve_checksum(bucket, key)
+
+    try:
+        if cached := cache.get(bucket, key, etag, size):
+            return Checksum(*cached)
+    except Exception:
+        print(f'{traceback.format_exc()}Could not read cached checksum for s3://{bucket}/{key}')
+
+    checksum = _resolve_checksum(bucket, key)
+    try:
+        cache.put(bucket, key, etag, size, (checksum.value, checksum.type))
+    except Exception:
+        print(f'{traceback.format_exc()}Could not cache checksum for s3://{bucket}/{key}')
+    return checksum
+
+
+def get_checksums(bucket: str, objects: list[S3Object], max_workers: int = MAX_HASH_WORKERS) -> list[Checksum]:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(get_checksum, bucket, obj.key, obj.etag, obj.size) for obj in objects]
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def list_objects_for_job(bucket: str, job_id: str) -> Iterator[S3Object]:
+    paginator = get_s3_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=job_id):
+        for obj in page.get('Contents', []):
+            yield S3Object(key=obj['Key'], size=obj['Size'], etag=obj['ETag'])
+
+
+def _dumps(obj: object) -> str:
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def _get_entry(queue_url: str, message: ingest_message.IngestMessage) -> dict | None:
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    body = _dumps(message)
+    body_bytes = len(body.encode())
+    if body_bytes <= SQS_MAX_BATCH_BYTES:
+        print(f'Publishing {message["identifier"]} to {queue_url}')
+        return {'MessageBody': body}
+
+    if not (bucket := os.environ.get('CLAIM_CHECK_BUCKET')):
+        print(f'Could not publish {message["identifier"]} to {queue_url}: message is larger than 256 KB')
+        return None
+
+    key = f'{message["collection"]}/{message["identifier"]}/{uuid.uuid4()}.json'
+    try:
+        get_s3_client().put_object(Bucket=bucket, Key=key, Body=body.encode(), ContentType='application/json')
+    except (BotoCoreError, ClientError) as e:
+        print(f'Could not write {message["identifier"]} to s3://{bucket}/{key}: {e}')
+        return None
+
+    print(f'Publishing {message["identifier"]} to {queue_url} via s3://{bucket}/{key}')
+    return {
+        'MessageBody': _dumps([PAYLOAD_S3_POINTER_CLASS, {'s3BucketName': bucket, 's3Key': key}]),
+        'MessageAttributes': {
+            EXTENDED_PAYLOAD_SIZE_ATTRIBUTE: {'DataType': 'Number', 'StringValue': str(body_bytes)},
+        },
+    }
+
+
+def _get_entry_bytes(entry: dict) -> int:
+    # SQS counts message attribute names, types, and values towards the size limit along with the body.
+    attributes = entry.get('MessageAttributes', {})
+    return len(entry['MessageBody'].encode()) + sum(
+        len(name) + len(attribute['DataType']) + len(attribute['StringValue']) for name, attribute in attributes.items()
+    )
+
+
+def _batch_entries(entries: dict[str, dict]) -> Iterator[list[dict]]:
+    batch: list[dict] = []
+    batch_bytes = 0
+    for entry_id, entry in entries.items():
+        entry_bytes = _get_entry_bytes(entry)
+        if batch and (len(batch) == SQS_MAX_BATCH_ENTRIES or batch_bytes + entry_bytes > SQS_MAX_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append({'Id': entry_id, **entry})
+        batch_bytes += entry_bytes
+    if batch:
+        yield batch
+
+
+def send_ingest_messages(queue_url: str, messages: list[ingest_message.IngestMessage]) -> list[bool]:
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    pending: dict[str, dict] = {}
+    for index, message in enumerate(messages):
+        if (entry := _get_entry(queue_url, message)) is not None:
+            pending[str(index)] = entry
+
+    sent = [False] * len(messages)
+    for attempt in range(SQS_MAX_SEND_ATTEMPTS):
+        if attempt:
+            # Failed entries are usually throttled, so back off exponentially with full jitter before resending them.
+            time.sleep(random.uniform(0, SQS_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+        retryable: dict[str, dict] = {}
+        for batch in _batch_entries(pending):
+            try:
+                response = get_sqs_client().send_message_batch(QueueUrl=queue_url, Entries=batch)
+            except (BotoCoreError, ClientError) as e:
+                print(f'Could not send batch of {len(batch)} messages to {queue_url}: {e}')
+                retryable.update({entry['Id']: pending[entry['Id']] for entry in batch})
+                continue
+
+            for success in response.get('Successful', []):
+                sent[int(success['Id'])] = True
+            for failure in response.get('Failed', []):
+                identifier = messages[int(failure['Id'])]['identifier']
+                print(f'Could not publish {identifier} to {queue_url}: {failure["Code"]} {failure.get("Message")}')
+                if not failure['SenderFault']:
+                    retryable[failure['Id']] = pending[failure['Id']]
+        pending = retryable
+        if not pending:
+            break
+
+    return sent
+
+
+OnSent = Callable[[], None]
+
+
+class Publish(Protocol):
+    def __call__(
+        self, queue_url: str, message: ingest_message.IngestMessage, on_sent: OnSent | None = None
+    ) -> None: ...
+
+
+class IngestMessagePublisher:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: defaultdict[str, list[tuple[str, ingest_message.IngestMessage, OnSent | None]]] = defaultdict(
+            list
+        )
+
+    def publish(
+        self, queue_url: str, message: ingest_message.IngestMessage, on_sent: OnSent | None = None, tag: str = ''
+    ) -> None:
+        with self._lock:
+            self._pending[queue_url].append((tag, message, on_sent))
+
+    def discard(self, tag: str) -> None:
+        with self._lock:
+            for queue_url, entries in self._pending.items():
+                self._pending[queue_url] = [entry for entry in entries if entry[0] != tag]
 
+    def flush(self, tag: str | None = None) -> set[str]:
+        with self._lock:
+            if tag is None:
+                pending, self._pending = self._pending, defaultdict(list)
+            else:
+                pending = defaultdict(list)
+                for queue_url, entries in self._pending.items():
+                    pending[queue_url] = [entry for entry in entries if entry[0] == tag]
+                    self._pending[queue_url] = [entry for entry in entries if entry[0] != tag]
 
-def send_ingest_message(queue_url: str, message: ingest_message.IngestMessage) -> None:
-    print(f'Publishing {message["identifier"]} to {queue_url}')
-    SQS_CLIENT.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message))
+        failed_tags: set[str] = set()
+        for queue_url, entries in pending.items():
+            if not entries:
+                continue
+            messages = [message for _, message, _ in entries]
+            with metrics.joined_spans(collection=messages[0]['collection']), metrics.timed('sqs_send'):
+                results = send_ingest_messages(queue_url, messages)
+            for (tag, message, on_sent), sent in zip(entries, results, strict=True):
+                if not sent:
+                    failed_tags.add(tag)
+                    continue
+                util.mark_sent(message['collection'], message['identifier'])
+                if on_sent is not None:
+                    # The message was sent, so failing to record that only costs a CMR check if it is redelivered.
+                    try:
+                        on_sent()
+                    except Exception:
+                        print(f'{traceback.format_exc()}Could not record that {message["identifier"]} was sent')
+        return failed_tags
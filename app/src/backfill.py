@@ -0,0 +1,163 @@
+import argparse
+import datetime
+import json
+import os
+import threading
+import traceback
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import app
+import aws
+import ingest_message
+import ratelimit
+import util
+
+
+class Checkpoint:
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.job_ids = set(path.read_text().split()) if path is not None and path.exists() else set()
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self.job_ids
+
+    def add(self, job_id: str) -> None:
+        with self._lock:
+            self.job_ids.add(job_id)
+            if self.path is not None:
+                with self.path.open('a') as f:
+                    f.write(f'{job_id}\n')
+
+
+def print_message(queue_url: str, message: ingest_message.IngestMessage, on_sent: aws.OnSent | None = None) -> None:
+    print(json.dumps({'queue_url': queue_url, 'message': message}))
+
+
+def read_job_ids(path: Path) -> Iterator[tuple[str, dict | None]]:
+    for line in path.read_text().splitlines():
+        if job_id := line.strip():
+            yield job_id, None
+
+
+def find_jobs(
+    hyp3_url: str,
+    credentials: dict,
+    job_type: str,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+    user_id: str | None,
+) -> Iterator[tuple[str, dict | None]]:
+    hyp3 = app.get_hyp3_client(hyp3_url, credentials['username'], credentials['password'])
+    batch = hyp3.find_jobs(start=start, end=end, status_code='SUCCEEDED', job_type=job_type, user_id=user_id)
+    print(f'Found {len(batch)} succeeded {job_type} jobs')
+    for job in batch:
+        yield job.job_id, job.to_dict()
+
+
+def backfill_job(hyp3_url: str, job_id: str, job: dict | None, credentials: dict, dry_run: bool) -> bool:
+    publisher = aws.IngestMessagePublisher()
+    publish = print_message if dry_run else publisher.publish
+    try:
+        # Jobs found by searching HyP3 are already complete, so they do not need to be fetched again.
+        if job is None:
+            app.process_message({'hyp3_url': hyp3_url, 'job_id': job_id}, credentials, publish)
+        else:
+            app.process_job(job, hyp3_url, publish)
+    except Exception:
+        print(f'{traceback.format_exc()}Could not backfill job {job_id}')
+        return False
+
+    if publisher.flush():
+        print(f'Could not publish all ingest messages for job {job_id}')
+        return False
+    return True
+
+
+def backfill(
+    hyp3_url: str,
+    jobs: Iterator[tuple[str, dict | None]],
+    credentials: dict,
+    checkpoint: Checkpoint,
+    workers: int,
+    rate: float | None = None,
+    dry_run: bool = False,
+) -> dict[str, int]:
+    # A fixed rate: the limiter's rate never grows, because on_success is not called.
+    rate_limiter = ratelimit.AdaptiveRateLimiter(rate, max_rate=rate) if rate else None
+    counts = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+    counts_lock = threading.Lock()
+
+    def run(job_id: str, job: dict | None) -> None:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        succeeded = backfill_job(hyp3_url, job_id, job, credentials, dry_run)
+        if succeeded and not dry_run:
+            checkpoint.add(job_id)
+        with counts_lock:
+            counts['succeeded' if succeeded else 'failed'] += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for job_id, job in jobs:
+            if job_id in checkpoint:
+                counts['skipped'] += 1
+                continue
+            futures.append(executor.submit(run, job_id, job))
+        for future in futures:
+            future.result()
+
+    return counts
+
+
+def get_args(args: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Publish the outputs of existing HyP3 jobs for ingest, using the same environment variables as the '
+        'Lambda function for the CMR domain, content bucket, and queue URLs'
+    )
+    parser.add_argument('--hyp3-url', type=str, default=os.getenv('HYP3_URL'))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--job-ids-file', type=Path, help='File with one job ID per line')
+    source.add_argument('--job-type', type=str, help='Search HyP3 for succeeded jobs of this type')
+    parser.add_argument('--start', type=datetime.datetime.fromisoformat, help='Only jobs submitted after this time')
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat, help='Only jobs submitted before this time')
+    parser.add_argument('--user-id', type=str, help='Only jobs submitted by this user')
+    parser.add_argument('--workers', type=int, default=util.get_max_record_workers())
+    parser.add_argument('--rate', type=float, help='Maximum number of jobs to start per second')
+    parser.add_argument('--checkpoint', type=Path, help='File recording backfilled job IDs, to resume from')
+    parser.add_argument('--dry-run', action='store_true', help='Print ingest messages instead of sending them')
+    parser.add_argument('--username', type=str, default=os.getenv('EARTHDATA_USERNAME'))
+    parser.add_argument('--password', type=str, default=os.getenv('EARTHDATA_PASSWORD'))
+    parsed_args = parser.parse_args(args)
+
+    if parsed_args.hyp3_url is None:
+        raise ValueError('HyP3 URL must be provided via the --hyp3-url option or the HYP3_URL environment variable')
+
+    return parsed_args
+
+
+def main() -> None:
+    args = get_args()
+
+    if args.username is not None:
+        credentials = {'username': args.username, 'password': args.password}
+    else:
+        credentials = app.load_credentials()
+
+    if args.job_ids_file is not None:
+        jobs = read_job_ids(args.job_ids_file)
+    else:
+        jobs = find_jobs(args.hyp3_url, credentials, args.job_type, args.start, args.end, args.user_id)
+
+    counts = backfill(
+        args.hyp3_url, jobs, credentials, Checkpoint(args.checkpoint), args.workers, args.rate, args.dry_run
+    )
+    print(f'Backfilled {counts["succeeded"]} jobs, {counts["failed"]} failed, {counts["skipped"]} already done')
+    if counts['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
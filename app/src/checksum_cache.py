@@ -0,0 +1,89 @@
+import functools
+import os
+from typing import Protocol
+
+import ttl_store
+
+
+DEFAULT_SQLITE_PATH = '/tmp/checksum_cache.sqlite3'
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# (checksum, checksumType)
+CachedChecksum = tuple[str, str]
+
+
+class ChecksumCache(Protocol):
+    def get(self, bucket: str, key: str, etag: str, size: int) -> CachedChecksum | None: ...
+
+    def put(self, bucket: str, key: str, etag: str, size: int, checksum: CachedChecksum) -> None: ...
+
+
+class SqliteChecksumCache(ttl_store.SqliteTtlStore):
+    def __init__(self, path: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        super().__init__(
+            path,
+            ttl_seconds,
+            'checksums',
+            'bucket TEXT, key TEXT, etag TEXT, size INTEGER, checksum TEXT, checksum_type TEXT',
+            'bucket, key, etag, size',
+        )
+
+    def get(self, bucket: str, key: str, etag: str, size: int) -> CachedChecksum | None:
+        rows = self._select(
+            'checksum, checksum_type', 'bucket = ? AND key = ? AND etag = ? AND size = ?', (bucket, key, etag, size)
+        )
+        return (rows[0][0], rows[0][1]) if rows else None
+
+    def put(self, bucket: str, key: str, etag: str, size: int, checksum: CachedChecksum) -> None:
+        self._insert(bucket, key, etag, size, *checksum)
+
+
+class DynamoDbChecksumCache(ttl_store.DynamoDbTtlStore):
+    def __init__(self, table_name: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        super().__init__(table_name, ttl_seconds)
+
+    @staticmethod
+    def _cache_key(bucket: str, key: str, etag: str, size: int) -> dict:
+        return {'cache_key': {'S': f's3://{bucket}/{key}#{etag}#{size}'}}
+
+    def get(self, bucket: str, key: str, etag: str, size: int) -> CachedChecksum | None:
+        if (item := self._get_item(self._cache_key(bucket, key, etag, size))) is None:
+            return None
+        return item['checksum']['S'], item['checksum_type']['S']
+
+    def put(self, bucket: str, key: str, etag: str, size: int, checksum: CachedChecksum) -> None:
+        self._put_item(
+            {
+                **self._cache_key(bucket, key, etag, size),
+                'checksum': {'S': checksum[0]},
+                'checksum_type': {'S': checksum[1]},
+            }
+        )
+
+
+class TieredChecksumCache:
+    def __init__(self, caches: list[ChecksumCache]) -> None:
+        self.caches = caches
+
+    def get(self, bucket: str, key: str, etag: str, size: int) -> CachedChecksum | None:
+        for index, cache in enumerate(self.caches):
+            if (checksum := cache.get(bucket, key, etag, size)) is not None:
+                for faster_cache in self.caches[:index]:
+                    faster_cache.put(bucket, key, etag, size, checksum)
+                return checksum
+        return None
+
+    def put(self, bucket: str, key: str, etag: str, size: int, checksum: CachedChecksum) -> None:
+        for cache in self.caches:
+            cache.put(bucket, key, etag, size, checksum)
+
+
+@functools.cache
+def get_checksum_cache() -> ChecksumCache:
+    ttl_seconds = int(os.environ.get('CHECKSUM_CACHE_TTL', DEFAULT_TTL_SECONDS))
+    sqlite_cache = SqliteChecksumCache(os.environ.get('CHECKSUM_CACHE_PATH', DEFAULT_SQLITE_PATH), ttl_seconds)
+
+    if table_name := os.environ.get('CHECKSUM_CACHE_TABLE'):
+        return TieredChecksumCache([sqlite_cache, DynamoDbChecksumCache(table_name, ttl_seconds)])
+
+    return sqlite_cache
@@ -0,0 +1,59 @@
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import ingest_message
+
+
+@dataclass(frozen=True)
+class Collection:
+    short_name: str
+    data_version: str
+    # File name suffix, including the leading '.', to CNM file type.
+    file_types: dict[str, str]
+    granule_ur_pattern: Callable[[str], str]
+    # Suffixes grouped by their last extension, longest first, so that '.iso.xml' takes precedence over '.xml'.
+    suffix_table: dict[str, list[tuple[str, str]]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        suffix_table: dict[str, list[tuple[str, str]]] = {}
+        for suffix, file_type in sorted(self.file_types.items(), key=lambda item: len(item[0]), reverse=True):
+            suffix_table.setdefault(suffix[suffix.rfind('.') :], []).append((suffix, file_type))
+        object.__setattr__(self, 'suffix_table', suffix_table)
+
+    def get_file_type(self, key: str) -> str:
+        for suffix, file_type in self.suffix_table.get(key[key.rfind('.') :], ()):
+            if key.endswith(suffix):
+                return file_type
+        raise ValueError(f'Could not determine file type for {key}')
+
+
+def _aria_s1_gunw_granule_ur_pattern(granule_ur: str) -> str:
+    return granule_ur.rsplit('-', 1)[0] + '-*'
+
+
+def _opera_rtc_granule_ur_pattern(granule_ur: str) -> str:
+    return f'{granule_ur[:49]}*{granule_ur[64:]}'
+
+
+ARIA_S1_GUNW = Collection(
+    short_name=ingest_message.ARIA_S1_GUNW_COLLECTION,
+    data_version='1',
+    file_types={
+        '.nc': 'data',
+        '.png': 'browse',
+        '.json': 'metadata',
+    },
+    granule_ur_pattern=_aria_s1_gunw_granule_ur_pattern,
+)
+
+OPERA_RTC = Collection(
+    short_name=ingest_message.OPERA_RTC_COLLECTION,
+    data_version='1.0',
+    file_types={
+        '.tif': 'data',
+        '.h5': 'data',
+        '.png': 'browse',
+        '.iso.xml': 'metadata',
+    },
+    granule_ur_pattern=_opera_rtc_granule_ur_pattern,
+)
@@ -3,7 +3,9 @@ import pathlib
 from dataclasses import dataclass
 
 import aws
+import collection
 import ingest_message
+import metrics
 import util
 
 
@@ -13,6 +15,8 @@ class JobTypeIngestConfig:
     user_id: str
 
 
+COLLECTION = collection.ARIA_S1_GUNW
+
 GUNW_USERNAME = 'access_cloud_based_insar'
 A19_URL = 'https://hyp3-a19-jpl.asf.alaska.edu'
 TIBET_URL = 'https://hyp3-tibet-jpl.asf.alaska.edu'
@@ -26,46 +30,47 @@ INGEST_CONFIGS = {
 
 
 def _granule_ur_pattern(granule_ur: str) -> str:
-    return granule_ur.rsplit('-', 1)[0] + '-*'
+    return COLLECTION.granule_ur_pattern(granule_ur)
 
 
 def _get_file_type(key: str) -> str:
-    if key.endswith('.nc'):
-        return 'data'
-    elif key.endswith('.png'):
-        return 'browse'
-    elif key.endswith('.json'):
-        return 'metadata'
-    else:
-        raise ValueError(f'Could not determine file type for {key}')
+    return COLLECTION.get_file_type(key)
+
+
+def _get_product_name(hyp3_job_dict: dict) -> str:
+    return pathlib.Path(hyp3_job_dict['files'][0]['s3']['key']).stem
 
 
 def _generate_ingest_message(hyp3_job_dict: dict) -> ingest_message.IngestMessage:
     bucket = hyp3_job_dict['files'][0]['s3']['bucket']
-    response = aws.list_objects_for_job(bucket, hyp3_job_dict['job_id'])
+    # Every output of the job is a file of its one product, so the whole listing is needed before the message is built.
+    with metrics.timed('s3_list'):
+        objects = list(aws.list_objects_for_job(bucket, hyp3_job_dict['job_id']))
+    with metrics.timed('checksum'):
+        checksums = aws.get_checksums(bucket, objects)
 
     files: list[ingest_message.IngestProductFile] = [
         {
-            'name': pathlib.Path(obj['Key']).name,
-            'type': _get_file_type(obj['Key']),
-            'uri': f's3://{bucket}/{obj["Key"]}',
-            'size': obj['Size'],
-            'checksum': aws.md5_for_s3_file(bucket, obj['Key']),
-            'checksumType': 'md5',
+            'name': pathlib.Path(obj.key).name,
+            'type': _get_file_type(obj.key),
+            'uri': f's3://{bucket}/{obj.key}',
+            'size': obj.size,
+            'checksum': checksum.value,
+            'checksumType': checksum.type,
         }
-        for obj in response['Contents']
+        for obj, checksum in zip(objects, checksums, strict=True)
     ]
 
-    product_name = pathlib.Path(hyp3_job_dict['files'][0]['s3']['key']).stem
+    product_name = _get_product_name(hyp3_job_dict)
     product: ingest_message.IngestProduct = {
         'name': product_name,
         'files': files,
-        'dataVersion': '1',
+        'dataVersion': COLLECTION.data_version,
     }
 
     return {
         'identifier': product_name,
-        'collection': ingest_message.ARIA_S1_GUNW_COLLECTION,
+        'collection': COLLECTION.short_name,
         'version': ingest_message.CNM_SCHEMA_VERSION,
         'submissionTime': util.get_submission_time(),
         'product': product,
@@ -91,13 +96,18 @@ def _qualifies_for_ingest(job: dict, hyp3_url: str) -> bool:
     return True
 
 
-def process_job(job: dict, hyp3_url: str) -> None:
+def process_job(job: dict, hyp3_url: str, publish: aws.Publish) -> None:
     if _qualifies_for_ingest(job, hyp3_url):
+        metrics.set_dimensions(collection=COLLECTION.short_name)
+        if util.was_recently_sent(COLLECTION.short_name, _get_product_name(job)):
+            return
         message = _generate_ingest_message(job)
-        if not util.exists_in_cmr(
-            os.environ['CMR_DOMAIN'],
-            ingest_message.ARIA_S1_GUNW_COLLECTION,
-            message['identifier'],
-            _granule_ur_pattern,
-        ):
-            aws.send_ingest_message(os.environ['GUNW_QUEUE_URL'], message)
+        with metrics.timed('cmr_check'):
+            exists = util.exists_in_cmr(
+                os.environ['CMR_DOMAIN'],
+                COLLECTION.short_name,
+                message['identifier'],
+                _granule_ur_pattern,
+            )
+        if not exists:
+            publish(os.environ['GUNW_QUEUE_URL'], message)
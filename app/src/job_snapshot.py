@@ -0,0 +1,25 @@
+import hashlib
+import hmac
+import json
+
+
+# Version 1 snapshots carried an unkeyed SHA-256 digest, which anyone able to publish to the topic could recompute.
+VERSION = 2
+FIELDS = ('job_id', 'job_type', 'user_id', 'files')
+
+
+def get_signature(job: dict, key: str) -> str:
+    content = json.dumps(job, sort_keys=True, separators=(',', ':')).encode()
+    return hmac.new(key.encode(), content, hashlib.sha256).hexdigest()
+
+
+def create(job: dict, key: str) -> dict:
+    snapshot = {field: job[field] for field in FIELDS}
+    return {'version': VERSION, 'job': snapshot, 'signature': get_signature(snapshot, key)}
+
+
+def is_signed(snapshot: dict, key: str) -> bool:
+    job, signature = snapshot.get('job'), snapshot.get('signature')
+    if not isinstance(job, dict) or not isinstance(signature, str):
+        return False
+    return hmac.compare_digest(signature, get_signature(job, key))
@@ -0,0 +1,73 @@
+import contextlib
+import contextvars
+import functools
+import os
+from collections.abc import Iterator
+from typing import Protocol
+
+import ttl_store
+
+
+DEFAULT_SQLITE_PATH = '/tmp/ledger.sqlite3'
+# SQS keeps a message for at most 14 days, so it cannot be redelivered after that.
+DEFAULT_TTL_SECONDS = 14 * 24 * 60 * 60
+
+# The SNS message ID of the record being processed. It is the same for every SQS redelivery of a record, but differs
+# each time a job is published, so that deliberately re-publishing a job sends its messages again.
+_DELIVERY_ID: contextvars.ContextVar[str | None] = contextvars.ContextVar('delivery_id', default=None)
+
+
+class Ledger(Protocol):
+    # Returns the identifiers that were sent while processing the delivery.
+    def get_sent(self, delivery_id: str) -> set[str]: ...
+
+    def record(self, delivery_id: str, identifier: str) -> None: ...
+
+
+@contextlib.contextmanager
+def delivery(delivery_id: str | None) -> Iterator[None]:
+    token = _DELIVERY_ID.set(delivery_id)
+    try:
+        yield
+    finally:
+        _DELIVERY_ID.reset(token)
+
+
+def get_delivery_id() -> str | None:
+    return _DELIVERY_ID.get()
+
+
+class SqliteLedger(ttl_store.SqliteTtlStore):
+    def __init__(self, path: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        super().__init__(path, ttl_seconds, 'sent', 'delivery_id TEXT, identifier TEXT', 'delivery_id, identifier')
+
+    def get_sent(self, delivery_id: str) -> set[str]:
+        return {identifier for (identifier,) in self._select('identifier', 'delivery_id = ?', (delivery_id,))}
+
+    def record(self, delivery_id: str, identifier: str) -> None:
+        self._insert(delivery_id, identifier)
+
+
+class DynamoDbLedger(ttl_store.DynamoDbTtlStore):
+    def __init__(self, table_name: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> None:
+        super().__init__(table_name, ttl_seconds)
+
+    def get_sent(self, delivery_id: str) -> set[str]:
+        items = self._query(
+            KeyConditionExpression='delivery_id = :delivery_id',
+            ExpressionAttributeValues={':delivery_id': {'S': delivery_id}},
+        )
+        return {item['identifier']['S'] for item in items}
+
+    def record(self, delivery_id: str, identifier: str) -> None:
+        self._put_item({'delivery_id': {'S': delivery_id}, 'identifier': {'S': identifier}})
+
+
+@functools.cache
+def get_ledger() -> Ledger:
+    ttl_seconds = int(os.environ.get('LEDGER_TTL', DEFAULT_TTL_SECONDS))
+
+    if table_name := os.environ.get('LEDGER_TABLE'):
+        return DynamoDbLedger(table_name, ttl_seconds)
+
+    return SqliteLedger(os.environ.get('LEDGER_PATH', DEFAULT_SQLITE_PATH), ttl_seconds)
@@ -0,0 +1,78 @@
+import contextlib
+import contextvars
+import json
+import os
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+
+DEFAULT_NAMESPACE = 'IngestAdapter'
+
+
+@dataclass
+class Spans:
+    dimensions: dict[str, str]
+    durations: dict[str, float] = field(default_factory=dict)
+
+
+_SPANS: contextvars.ContextVar[Spans | None] = contextvars.ContextVar('spans', default=None)
+
+
+def _emit(spans: Spans) -> None:
+    # CloudWatch Logs extracts metrics from log lines in the Embedded Metric Format, so no API calls are needed.
+    # See https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+    metrics = {
+        'Namespace': os.environ.get('METRICS_NAMESPACE', DEFAULT_NAMESPACE),
+        'Dimensions': [sorted(spans.dimensions)],
+        'Metrics': [{'Name': stage, 'Unit': 'Milliseconds'} for stage in spans.durations],
+    }
+    document = {
+        '_aws': {'Timestamp': int(time.time() * 1000), 'CloudWatchMetrics': [metrics]},
+        **spans.dimensions,
+        **{stage: round(duration, 3) for stage, duration in spans.durations.items()},
+    }
+    print(json.dumps(document))
+
+
+@contextlib.contextmanager
+def spans(**dimensions: str) -> Iterator[Spans]:
+    current = Spans(dimensions)
+    token = _SPANS.set(current)
+    try:
+        yield current
+    finally:
+        _SPANS.reset(token)
+        if current.durations:
+            _emit(current)
+
+
+@contextlib.contextmanager
+def joined_spans(**dimensions: str) -> Iterator[Spans]:
+    # Stages run on behalf of a record, like sending its messages, are reported in the record's document.
+    if (current := _SPANS.get()) is not None:
+        yield current
+        return
+    with spans(**dimensions) as current:
+        yield current
+
+
+def set_dimensions(**dimensions: str) -> None:
+    if (current := _SPANS.get()) is not None:
+        current.dimensions.update(dimensions)
+
+
+@contextlib.contextmanager
+def timed(stage: str) -> Iterator[None]:
+    current = _SPANS.get()
+    if current is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        # Stages that run more than once per record, like checksums for each OPERA product, are added together.
+        duration = (time.perf_counter() - start) * 1000
+        current.durations[stage] = current.durations.get(stage, 0.0) + duration
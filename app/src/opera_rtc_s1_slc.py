@@ -1,56 +1,88 @@
+import functools
 import os
+from collections.abc import Container
 from pathlib import Path
 
 import aws
+import collection
 import ingest_message
+import ledger
+import metrics
 import util
 
 
-def _granule_ur_pattern(granule_ur: str) -> str:
-    return f'{granule_ur[:49]}*{granule_ur[64:]}'
+COLLECTION = collection.OPERA_RTC
 
 
-def _get_file_type(key: str) -> str:
-    if key.endswith('.tif') or key.endswith('.h5'):
-        return 'data'
-    elif key.endswith('.png'):
-        return 'browse'
-    elif key.endswith('.iso.xml'):
-        return 'metadata'
-    else:
-        raise ValueError(f'Could not determine file type for {key}')
+def _granule_ur_pattern(granule_ur: str) -> str:
+    return COLLECTION.granule_ur_pattern(granule_ur)
 
 
-def _get_products(bucket: str, job_id: str) -> list[ingest_message.IngestProduct]:
-    response = aws.list_objects_for_job(bucket, job_id)
+def _get_file_type(key: str) -> str:
+    return COLLECTION.get_file_type(key)
 
-    product_names = {Path(obj['Key']).stem for obj in response['Contents'] if obj['Key'].endswith('.h5')}
 
+def _get_files(bucket: str, objects: list[aws.S3Object]) -> list[ingest_message.IngestProductFile]:
+    with metrics.timed('checksum'):
+        checksums = aws.get_checksums(bucket, objects)
     return [
         {
-            'name': product_name,
-            'files': [
-                {
-                    'name': Path(obj['Key']).name,
-                    'type': _get_file_type(obj['Key']),
-                    'uri': f's3://{bucket}/{obj["Key"]}',
-                    'size': obj['Size'],
-                    'checksum': obj['ETag'].strip('"'),
-                    'checksumType': 'md5',
-                }
-                for obj in response['Contents']
-                if product_name in obj['Key']
-            ],
-            'dataVersion': '1.0',
+            'name': Path(obj.key).name,
+            'type': _get_file_type(obj.key),
+            'uri': f's3://{bucket}/{obj.key}',
+            'size': obj.size,
+            'checksum': checksum.value,
+            'checksumType': checksum.type,
         }
-        for product_name in product_names
+        for obj, checksum in zip(objects, checksums, strict=True)
     ]
 
 
+def _get_product_name(filename: str, product_names: Container[str]) -> str | None:
+    # Files are named after their product followed by a suffix starting with '_' or '.', like product_VV.tif or
+    # product.iso.xml, so the longest prefix that ends at a separator and names a product is the file's product.
+    end = len(filename)
+    while (end := max(filename.rfind('_', 0, end), filename.rfind('.', 0, end))) > 0:
+        if filename[:end] in product_names:
+            return filename[:end]
+    return None
+
+
+def _group_by_product(objects: list[aws.S3Object]) -> dict[str, list[aws.S3Object]]:
+    products: dict[str, list[aws.S3Object]] = {Path(obj.key).stem: [] for obj in objects if obj.key.endswith('.h5')}
+    for obj in objects:
+        if (product_name := _get_product_name(Path(obj.key).name, products)) is not None:
+            products[product_name].append(obj)
+    return products
+
+
+def _get_products(bucket: str, job_id: str, sent: Container[str] = ()) -> list[ingest_message.IngestProduct]:
+    with metrics.timed('s3_list'):
+        objects = list(aws.list_objects_for_job(bucket, job_id))
+
+    products: list[ingest_message.IngestProduct] = []
+    for product_name, product_objects in _group_by_product(objects).items():
+        # Products sent before the record was redelivered or by a recent invocation are skipped before their files
+        # are hashed.
+        if product_name in sent:
+            print(f'{product_name} was already sent for ingest by an earlier delivery of job {job_id}')
+            continue
+        if util.was_recently_sent(COLLECTION.short_name, product_name):
+            continue
+        products.append(
+            {
+                'name': product_name,
+                'files': _get_files(bucket, product_objects),
+                'dataVersion': COLLECTION.data_version,
+            }
+        )
+    return products
+
+
 def _get_message(product: ingest_message.IngestProduct) -> ingest_message.IngestMessage:
     return {
         'identifier': product['name'],
-        'collection': ingest_message.OPERA_RTC_COLLECTION,
+        'collection': COLLECTION.short_name,
         'version': ingest_message.CNM_SCHEMA_VERSION,
         'submissionTime': util.get_submission_time(),
         'product': product,
@@ -59,21 +91,27 @@ def _get_message(product: ingest_message.IngestProduct) -> ingest_message.Ingest
     }
 
 
-def _send_messages(queue_url: str, messages: list[ingest_message.IngestMessage]) -> None:
+def _send_messages(queue_url: str, messages: list[ingest_message.IngestMessage], publish: aws.Publish) -> None:
+    delivery_id = ledger.get_delivery_id()
     for message in messages:
-        aws.send_ingest_message(queue_url, message)
+        on_sent = None
+        if delivery_id is not None:
+            on_sent = functools.partial(ledger.get_ledger().record, delivery_id, message['identifier'])
+        publish(queue_url, message, on_sent=on_sent)
 
 
-def process_job(job: dict) -> None:
-    products = _get_products(os.environ['HYP3_CONTENT_BUCKET'], job['job_id'])
-    messages = [
-        _get_message(product)
-        for product in products
-        if not util.exists_in_cmr(
+def process_job(job: dict, publish: aws.Publish) -> None:
+    metrics.set_dimensions(collection=COLLECTION.short_name)
+    # Jobs that are not processed from an SNS notification, like backfills, are always sent in full.
+    delivery_id = ledger.get_delivery_id()
+    sent = ledger.get_ledger().get_sent(delivery_id) if delivery_id is not None else set()
+    products = _get_products(os.environ['HYP3_CONTENT_BUCKET'], job['job_id'], sent)
+    with metrics.timed('cmr_check'):
+        existing_granule_urs = util.find_in_cmr(
             os.environ['CMR_DOMAIN'],
-            ingest_message.OPERA_RTC_COLLECTION,
-            product['name'],
+            COLLECTION.short_name,
+            [product['name'] for product in products],
             _granule_ur_pattern,
         )
-    ]
-    _send_messages(os.environ['OPERA_RTC_QUEUE_URL'], messages)
+    messages = [_get_message(product) for product in products if existing_granule_urs[product['name']] is None]
+    _send_messages(os.environ['OPERA_RTC_QUEUE_URL'], messages, publish)
@@ -0,0 +1,78 @@
+import email.utils
+import threading
+import time
+
+
+MIN_RATE = 0.5
+# Requests per second added after every successful request, and the factor applied when an endpoint throttles us.
+ADDITIVE_INCREASE = 0.1
+MULTIPLICATIVE_DECREASE = 0.5
+# A burst of concurrent requests can all be throttled at once, which should only count as one signal.
+DECREASE_INTERVAL_SECONDS = 1.0
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate: float, max_rate: float) -> None:
+        self.rate = rate
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._updated_at = time.monotonic()
+        self._decreased_at = float('-inf')
+
+    def _refill(self, now: float) -> None:
+        # Allow bursts of up to one second's worth of requests. No tokens are added while blocked by a Retry-After.
+        self._tokens = min(max(self.rate, 1.0), self._tokens + max(0.0, now - self._updated_at) * self.rate)
+        self._updated_at = max(now, self._updated_at)
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve a token now, so that concurrent callers are paced one after another rather than all at once.
+            self._tokens -= 1
+            wait = self._updated_at - now + max(0.0, -self._tokens) / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE)
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased_at >= DECREASE_INTERVAL_SECONDS:
+                self._refill(now)
+                self.rate = max(MIN_RATE, self.rate * MULTIPLICATIVE_DECREASE)
+                self._tokens = min(self._tokens, 0.0)
+                self._decreased_at = now
+            if retry_after is not None:
+                self._updated_at = max(self._updated_at, now + retry_after)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    # Retry-After is either a number of seconds or an HTTP date.
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+RATE_LIMITERS: dict[str, AdaptiveRateLimiter] = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(endpoint: str, rate: float, max_rate: float) -> AdaptiveRateLimiter:
+    # One limiter per endpoint is shared by every worker thread in the process, and kept across warm invocations.
+    with RATE_LIMITERS_LOCK:
+        if endpoint not in RATE_LIMITERS:
+            RATE_LIMITERS[endpoint] = AdaptiveRateLimiter(rate, max_rate)
+        return RATE_LIMITERS[endpoint]
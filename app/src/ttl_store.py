@@ -0,0 +1,63 @@
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import closing
+
+import util
+
+
+class SqliteTtlStore:
+    def __init__(self, path: str, ttl_seconds: int, table: str, columns: str, primary_key: str) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ({columns}, expires_at REAL, PRIMARY KEY ({primary_key}))'
+            )
+            connection.execute(f'DELETE FROM {table} WHERE expires_at <= ?', (time.time(),))
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call keeps the store safe to share between threads.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _select(self, columns: str, where: str, parameters: tuple) -> list[tuple]:
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                f'SELECT {columns} FROM {self.table} WHERE {where} AND expires_at > ?',
+                (*parameters, time.time()),
+            ).fetchall()
+
+    def _insert(self, *values: object) -> None:
+        placeholders = ', '.join('?' * (len(values) + 1))
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                f'INSERT OR REPLACE INTO {self.table} VALUES ({placeholders})',
+                (*values, time.time() + self.ttl_seconds),
+            )
+
+
+class DynamoDbTtlStore:
+    def __init__(self, table_name: str, ttl_seconds: int) -> None:
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.client = util.create_boto3_client('dynamodb')
+
+    @staticmethod
+    def _is_live(item: dict) -> bool:
+        # DynamoDB can take a while to delete expired items, so check the expiration time ourselves.
+        return float(item['expires_at']['N']) > time.time()
+
+    def _get_item(self, key: dict) -> dict | None:
+        item = self.client.get_item(TableName=self.table_name, Key=key).get('Item')
+        return item if item is not None and self._is_live(item) else None
+
+    def _query(self, **kwargs: object) -> Iterator[dict]:
+        for page in self.client.get_paginator('query').paginate(TableName=self.table_name, **kwargs):
+            yield from (item for item in page['Items'] if self._is_live(item))
+
+    def _put_item(self, item: dict) -> None:
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={**item, 'expires_at': {'N': str(int(time.time() + self.ttl_seconds))}},
+        )
@@ -1,24 +1,216 @@
 import datetime
-from collections.abc import Callable
+import fnmatch
+import functools
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from types import TracebackType
+from typing import TYPE_CHECKING, Self
 
-import requests
+import ratelimit
 
 
-def exists_in_cmr(cmr_domain: str, short_name: str, granule_ur: str, granule_ur_pattern: Callable[[str], str]) -> bool:
-    url = f'https://{cmr_domain}/search/granules.umm_json'
-    params = {
-        'short_name': short_name,
-        'granule_ur': granule_ur_pattern(granule_ur),
-        'options[granule_ur][pattern]': 'true',
-        'page_size': '1',
-    }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    if response.json()['items']:
-        print(f'{granule_ur} already exists in CMR as {response.json()["items"][0]["umm"]["GranuleUR"]}')
+if TYPE_CHECKING:
+    import requests
+    from botocore.client import BaseClient
+    from urllib3.connectionpool import ConnectionPool
+    from urllib3.response import BaseHTTPResponse
+
+
+CMR_BATCH_SIZE = 50
+CMR_PAGE_SIZE = 2000
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_MAX_RECORD_WORKERS = 4
+DEFAULT_CMR_RATE_LIMIT = 10.0
+DEFAULT_CMR_MAX_RATE_LIMIT = 50.0
+DEFAULT_CACHE_SIZE = 10_000
+# Granules are not removed from CMR by reprocessing, so a positive result can be trusted for a long time.
+DEFAULT_CMR_CACHE_TTL_SECONDS = 24 * 60 * 60
+# Long enough to cover the delay between sending a message for ingest and the granule showing up in CMR.
+DEFAULT_RECENTLY_SENT_TTL_SECONDS = 60 * 60
+
+# Creating clients from boto3's default session is not thread-safe: concurrent first calls can fail while the session
+# loads its credential providers. Clients themselves are safe to share once created.
+BOTO3_CLIENT_LOCK = threading.Lock()
+
+
+def create_boto3_client(service_name: str, **kwargs: object) -> 'BaseClient':
+    import boto3
+
+    with BOTO3_CLIENT_LOCK:
+        return boto3.client(service_name, **kwargs)
+
+
+def get_max_record_workers() -> int:
+    return int(os.environ.get('MAX_RECORD_WORKERS', DEFAULT_MAX_RECORD_WORKERS))
+
+
+class TtlCache[K: Hashable, V]:
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# Both caches live for as long as the Lambda container stays warm.
+@functools.cache
+def get_cmr_cache() -> TtlCache[tuple[str, str, str], str]:
+    return TtlCache(
+        int(os.environ.get('CMR_CACHE_SIZE', DEFAULT_CACHE_SIZE)),
+        float(os.environ.get('CMR_CACHE_TTL', DEFAULT_CMR_CACHE_TTL_SECONDS)),
+    )
+
+
+@functools.cache
+def get_recently_sent() -> TtlCache[tuple[str, str], bool]:
+    return TtlCache(
+        int(os.environ.get('RECENTLY_SENT_SIZE', DEFAULT_CACHE_SIZE)),
+        float(os.environ.get('RECENTLY_SENT_TTL', DEFAULT_RECENTLY_SENT_TTL_SECONDS)),
+    )
+
+
+def mark_sent(collection: str, identifier: str) -> None:
+    get_recently_sent().put((collection, identifier), True)
+
+
+def was_recently_sent(collection: str, identifier: str) -> bool:
+    if get_recently_sent().get((collection, identifier)):
+        print(f'{identifier} was recently sent for ingest into {collection}')
         return True
     return False
 
 
+def get_cmr_rate_limiter(host: str) -> ratelimit.AdaptiveRateLimiter:
+    return ratelimit.get_rate_limiter(
+        host,
+        float(os.environ.get('CMR_RATE_LIMIT', DEFAULT_CMR_RATE_LIMIT)),
+        float(os.environ.get('CMR_MAX_RATE_LIMIT', DEFAULT_CMR_MAX_RATE_LIMIT)),
+    )
+
+
+@functools.cache
+def get_cmr_session() -> 'requests.Session':
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class RateLimitedRetry(Retry):
+        # urllib3 retries throttled requests on its own, so they are reported to the rate limiter from here.
+        def increment(
+            self,
+            method: str | None = None,
+            url: str | None = None,
+            response: 'BaseHTTPResponse | None' = None,
+            error: Exception | None = None,
+            _pool: 'ConnectionPool | None' = None,
+            _stacktrace: TracebackType | None = None,
+        ) -> Self:
+            host = _pool.host if _pool is not None else urllib.parse.urlsplit(url or '').hostname
+            if response is not None and response.status == 429 and host:
+                get_cmr_rate_limiter(host).on_throttle(self.get_retry_after(response))
+            return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    pool_size = int(os.environ.get('CMR_POOL_SIZE', get_max_record_workers()))
+    retry = RateLimitedRetry(
+        total=int(os.environ.get('CMR_MAX_RETRIES', 3)),
+        backoff_factor=float(os.environ.get('CMR_BACKOFF_FACTOR', 0.5)),
+        backoff_jitter=float(os.environ.get('CMR_BACKOFF_JITTER', 0.5)),
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods={'GET'},
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+
+def get_cmr_timeout() -> tuple[float, float]:
+    return float(os.environ.get('CMR_CONNECT_TIMEOUT', 3.05)), float(os.environ.get('CMR_READ_TIMEOUT', 30))
+
+
+def _search_granule_urs(cmr_domain: str, short_name: str, patterns: list[str]) -> Iterator[str]:
+    url = f'https://{cmr_domain}/search/granules.json'
+    params = [
+        ('short_name', short_name),
+        *[('granule_ur[]', pattern) for pattern in patterns],
+        ('options[granule_ur][pattern]', 'true'),
+        ('page_size', str(CMR_PAGE_SIZE)),
+    ]
+    headers: dict[str, str] = {}
+    rate_limiter = get_cmr_rate_limiter(urllib.parse.urlsplit(url).hostname or cmr_domain)
+    while True:
+        rate_limiter.acquire()
+        response = get_cmr_session().get(url, params=params, headers=headers, timeout=get_cmr_timeout())
+        response.raise_for_status()
+        rate_limiter.on_success()
+        entries = response.json()['feed']['entry']
+        # The title of a granule in CMR's JSON format is its GranuleUR.
+        yield from (entry['title'] for entry in entries)
+
+        if len(entries) < CMR_PAGE_SIZE or 'CMR-Search-After' not in response.headers:
+            break
+        headers = {'CMR-Search-After': response.headers['CMR-Search-After']}
+
+
+def find_in_cmr(
+    cmr_domain: str,
+    short_name: str,
+    granule_urs: list[str],
+    granule_ur_pattern: Callable[[str], str],
+    batch_size: int = CMR_BATCH_SIZE,
+) -> dict[str, str | None]:
+    found: dict[str, str | None] = dict.fromkeys(granule_urs)
+    cache = get_cmr_cache()
+
+    for granule_ur in granule_urs:
+        if (existing_granule_ur := cache.get((cmr_domain, short_name, granule_ur))) is not None:
+            print(f'{granule_ur} already exists in CMR as {existing_granule_ur}')
+            found[granule_ur] = existing_granule_ur
+    uncached_granule_urs = [granule_ur for granule_ur in granule_urs if found[granule_ur] is None]
+
+    for start in range(0, len(uncached_granule_urs), batch_size):
+        patterns = {
+            granule_ur: granule_ur_pattern(granule_ur)
+            for granule_ur in uncached_granule_urs[start : start + batch_size]
+        }
+        for existing_granule_ur in _search_granule_urs(cmr_domain, short_name, list(patterns.values())):
+            for granule_ur, pattern in patterns.items():
+                if found[granule_ur] is None and fnmatch.fnmatchcase(existing_granule_ur, pattern):
+                    print(f'{granule_ur} already exists in CMR as {existing_granule_ur}')
+                    found[granule_ur] = existing_granule_ur
+                    cache.put((cmr_domain, short_name, granule_ur), existing_granule_ur)
+
+    return found
+
+
+def exists_in_cmr(cmr_domain: str, short_name: str, granule_ur: str, granule_ur_pattern: Callable[[str], str]) -> bool:
+    return find_in_cmr(cmr_domain, short_name, [granule_ur], granule_ur_pattern)[granule_ur] is not None
+
+
 def get_submission_time() -> str:
     return datetime.datetime.now(tz=datetime.UTC).isoformat().replace('+00:00', 'Z')
@@ -0,0 +1,65 @@
+import argparse
+import timeit
+from collections.abc import Callable
+
+import collection
+
+
+def opera_rtc_if_chain(key: str) -> str:
+    # The implementation before collection.Collection, for comparison.
+    if key.endswith('.tif') or key.endswith('.h5'):
+        return 'data'
+    elif key.endswith('.png'):
+        return 'browse'
+    elif key.endswith('.iso.xml'):
+        return 'metadata'
+    else:
+        raise ValueError(f'Could not determine file type for {key}')
+
+
+def get_keys(count: int, suffixes: list[str]) -> list[str]:
+    product = 'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0'
+    return [f'myJobId/{product}-{index}{suffixes[index % len(suffixes)]}' for index in range(count)]
+
+
+def get_collection(suffix_count: int) -> collection.Collection:
+    file_types = {f'.type{index}': 'data' for index in range(suffix_count - 2)}
+    file_types.update({'.iso.xml': 'metadata', '.png': 'browse'})
+    return collection.Collection(
+        short_name='myCollection',
+        data_version='1',
+        file_types=file_types,
+        granule_ur_pattern=lambda granule_ur: granule_ur,
+    )
+
+
+def time_per_key(classify: Callable[[str], str], keys: list[str], repeat: int) -> float:
+    seconds = min(timeit.repeat(lambda: [classify(key) for key in keys], number=1, repeat=repeat))
+    return seconds / len(keys) * 1e9
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Measure the cost of classifying output files by suffix')
+    parser.add_argument('--keys', type=int, default=100_000)
+    parser.add_argument('--suffix-counts', type=int, nargs='+', default=[4, 64, 1024])
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest is reported')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+
+    keys = get_keys(args.keys, ['.h5', '_VV.tif', '_VH.tif', '_BROWSE.png', '.iso.xml'])
+    print(f'{"classifier":>24} {"ns/key":>8}')
+    print(f'{"OPERA_RTC if chain":>24} {time_per_key(opera_rtc_if_chain, keys, args.repeat):>8.0f}')
+    print(f'{"OPERA_RTC table":>24} {time_per_key(collection.OPERA_RTC.get_file_type, keys, args.repeat):>8.0f}')
+
+    for suffix_count in args.suffix_counts:
+        table = get_collection(suffix_count)
+        keys = get_keys(args.keys, list(table.file_types))
+        name = f'{suffix_count} suffix table'
+        print(f'{name:>24} {time_per_key(table.get_file_type, keys, args.repeat):>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
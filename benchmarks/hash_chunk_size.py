@@ -0,0 +1,93 @@
+import argparse
+import hashlib
+import os
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+BUCKET = 'benchmark-bucket'
+KEY = 'benchmark.nc'
+
+
+def start_fake_s3(data: bytes) -> ThreadingHTTPServer:
+    # Serves every GetObject request with the same object, which is all md5_for_s3_file needs. Going over HTTP keeps
+    # botocore and urllib3 in the measurement, unlike moto's in-process responses.
+    class FakeS3Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self) -> None:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            view = memoryview(data)
+            for start in range(0, len(data), 1024 * 1024):
+                self.wfile.write(view[start : start + 1024 * 1024])
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeS3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(function: Callable[[str, str, int], str], chunk_size: int, repeat: int) -> tuple[float, float]:
+    best = min(_time(function, chunk_size) for _ in range(repeat))
+
+    tracemalloc.start()
+    function(BUCKET, KEY, chunk_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak / 1024 / 1024
+
+
+def _time(function: Callable[[str, str, int], str], chunk_size: int) -> float:
+    start = time.perf_counter()
+    function(BUCKET, KEY, chunk_size)
+    return time.perf_counter() - start
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Compare S3 object hashing throughput and memory across chunk sizes')
+    parser.add_argument('--size-mb', type=int, default=256, help='Size of the object to hash in MiB')
+    parser.add_argument(
+        '--chunk-sizes',
+        type=int,
+        nargs='+',
+        default=[64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 8 * 1024 * 1024],
+        help='Chunk sizes in bytes',
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the fastest is reported')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+
+    data = os.urandom(args.size_mb * 1024 * 1024)
+    server = start_fake_s3(data)
+    os.environ.update(
+        AWS_ENDPOINT_URL_S3=f'http://127.0.0.1:{server.server_address[1]}',
+        AWS_ACCESS_KEY_ID='benchmark',
+        AWS_SECRET_ACCESS_KEY='benchmark',
+        AWS_DEFAULT_REGION='us-west-2',
+    )
+
+    import aws
+
+    assert aws.md5_for_s3_file(BUCKET, KEY, 1024 * 1024) == hashlib.md5(data).hexdigest()
+
+    print(f'{"chunk size":>10} {"MB/s":>8} {"peak traced MB":>15}')
+    for chunk_size in args.chunk_sizes:
+        seconds, peak_mb = measure(aws.md5_for_s3_file, chunk_size, args.repeat)
+        print(f'{chunk_size:>10} {args.size_mb / seconds:>8.1f} {peak_mb:>15.2f}')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
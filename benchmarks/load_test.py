@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import resource
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+HYP3_URL = 'https://hyp3-load-test.asf.alaska.edu'
+BUCKET = 'load-test-bucket'
+OPERA_FILE_SUFFIXES = ('.h5', '.iso.xml', '_BROWSE.png', '_VV.tif', '_VH.tif', '_mask.tif')
+GUNW_FILE_SUFFIXES = ('.nc', '.png', '.json')
+
+
+@dataclass(frozen=True)
+class Scenario:
+    batch_size: int
+    invocations: int
+    job_type: str
+    opera_products: int
+    file_size: int
+    hyp3_latency: float
+    cmr_latency: float
+    max_record_workers: int
+
+
+@dataclass(frozen=True)
+class Result:
+    messages: int
+    seconds: float
+    latencies: list[float]
+    peak_rss_mb: float
+
+
+class FakeHyP3:
+    jobs: dict[str, dict] = {}
+    latency = 0.0
+
+    def __init__(self, api_url: str, username: str, password: str) -> None:
+        time.sleep(self.latency)
+
+    def get_job_by_id(self, job_id: str) -> 'FakeJob':
+        time.sleep(self.latency)
+        return FakeJob(self.jobs[job_id])
+
+
+@dataclass(frozen=True)
+class FakeJob:
+    job: dict
+
+    def to_dict(self) -> dict:
+        return self.job
+
+
+def _cmr_handler(latency: float) -> type[BaseHTTPRequestHandler]:
+    class FakeCmrHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            time.sleep(latency)
+            # Nothing has been ingested yet, so every product is published.
+            body = json.dumps({'feed': {'entry': []}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    return FakeCmrHandler
+
+
+def _write_self_signed_certificate(directory: Path) -> tuple[Path, Path]:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(tz=datetime.UTC)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName('localhost')]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    certificate_path = directory / 'cmr.pem'
+    key_path = directory / 'cmr.key'
+    certificate_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+    return certificate_path, key_path
+
+
+def start_fake_cmr(latency: float, directory: Path) -> ThreadingHTTPServer:
+    # The app only talks to CMR over HTTPS, so the fake CMR serves a self-signed certificate that requests trusts
+    # through REQUESTS_CA_BUNDLE.
+    certificate_path, key_path = _write_self_signed_certificate(directory)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certificate_path, key_path)
+
+    server = ThreadingHTTPServer(('localhost', 0), _cmr_handler(latency))
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ['REQUESTS_CA_BUNDLE'] = str(certificate_path)
+    os.environ['CMR_DOMAIN'] = f'localhost:{server.server_address[1]}'
+    return server
+
+
+def _put_objects(s3: 'BaseClient', job_id: str, names: list[str], suffixes: tuple[str, ...], file_size: int) -> None:
+    for name in names:
+        for suffix in suffixes:
+            s3.put_object(Bucket=BUCKET, Key=f'{job_id}/{name}{suffix}', Body=os.urandom(file_size))
+
+
+def create_job(s3: 'BaseClient', job_type: str, index: int, scenario: Scenario) -> dict:
+    job_id = str(uuid.uuid4())
+    if job_type == 'gunw':
+        name = f'S1-GUNW-D-R-036-tops-20250131_20241226-041630-00025E_00035N-PP-{index:04x}-v3_0_1'
+        _put_objects(s3, job_id, [name], GUNW_FILE_SUFFIXES, scenario.file_size)
+        return {
+            'job_id': job_id,
+            'job_type': 'ARIA_S1_GUNW',
+            'user_id': 'load-test',
+            'files': [{'s3': {'bucket': BUCKET, 'key': f'{job_id}/{name}.nc'}}],
+        }
+
+    names = [
+        f'OPERA_L2_RTC-S1_T{index % 1000:03d}-{product:06d}-IW1_20250813T204041Z_20250813T235131Z_S1A_30_v1.0'
+        for product in range(scenario.opera_products)
+    ]
+    _put_objects(s3, job_id, names, OPERA_FILE_SUFFIXES, scenario.file_size)
+    return {
+        'job_id': job_id,
+        'job_type': 'OPERA_RTC_S1_SLC',
+        'user_id': 'load-test',
+        'files': [{'s3': {'bucket': BUCKET, 'key': f'{job_id}/{job_id}.zip'}}],
+    }
+
+
+def _count_messages(sqs: 'BaseClient', queue_urls: list[str]) -> int:
+    count = 0
+    for queue_url in queue_urls:
+        response = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['ApproximateNumberOfMessages'])
+        count += int(response['Attributes']['ApproximateNumberOfMessages'])
+    return count
+
+
+def run_scenario(scenario: Scenario) -> Result:
+    os.environ.update(
+        AWS_ACCESS_KEY_ID='testing',
+        AWS_SECRET_ACCESS_KEY='testing',
+        AWS_DEFAULT_REGION='us-west-2',
+        HYP3_CONTENT_BUCKET=BUCKET,
+        MAX_RECORD_WORKERS=str(scenario.max_record_workers),
+    )
+    # The stand-ins never throttle, so the rate limiters should not cap throughput unless asked to.
+    os.environ.setdefault('CMR_RATE_LIMIT', '1000')
+    os.environ.setdefault('HYP3_RATE_LIMIT', '1000')
+
+    import boto3
+    from moto import mock_aws
+
+    with tempfile.TemporaryDirectory() as directory, mock_aws(), patch('hyp3_sdk.HyP3', FakeHyP3):
+        os.environ['CHECKSUM_CACHE_PATH'] = str(Path(directory) / 'checksum_cache.sqlite3')
+        os.environ['LEDGER_PATH'] = str(Path(directory) / 'ledger.sqlite3')
+        server = start_fake_cmr(scenario.cmr_latency, Path(directory))
+        FakeHyP3.latency = scenario.hyp3_latency
+
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'us-west-2'})
+        sqs = boto3.client('sqs')
+        queue_urls = [sqs.create_queue(QueueName=name)['QueueUrl'] for name in ('gunw', 'opera')]
+        os.environ['GUNW_QUEUE_URL'], os.environ['OPERA_RTC_QUEUE_URL'] = queue_urls
+        secret = boto3.client('secretsmanager').create_secret(
+            Name='edl', SecretString=json.dumps({'username': 'user', 'password': 'pass'})
+        )
+        os.environ['SECRET_ARN'] = secret['ARN']
+
+        events = []
+        for invocation in range(scenario.invocations):
+            records = []
+            for index in range(invocation * scenario.batch_size, (invocation + 1) * scenario.batch_size):
+                job_type = scenario.job_type if scenario.job_type != 'mixed' else ('gunw', 'opera')[index % 2]
+                job = create_job(s3, job_type, index, scenario)
+                FakeHyP3.jobs[job['job_id']] = job
+                message = {'hyp3_url': HYP3_URL, 'job_id': job['job_id']}
+                records.append({'messageId': str(uuid.uuid4()), 'body': json.dumps({'Message': json.dumps(message)})})
+            events.append({'Records': records})
+
+        import app
+
+        latencies = []
+        start = time.perf_counter()
+        for event in events:
+            invocation_start = time.perf_counter()
+            # The app logs every message it publishes, which would drown out the results.
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = app.lambda_handler(event, None)
+            latencies.append(time.perf_counter() - invocation_start)
+            if response['batchItemFailures']:
+                raise RuntimeError(f'Records failed: {response["batchItemFailures"]}')
+        seconds = time.perf_counter() - start
+
+        messages = _count_messages(sqs, queue_urls)
+        server.shutdown()
+
+    # ru_maxrss is reported in kilobytes on Linux.
+    return Result(messages, seconds, latencies, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def _percentile(values: list[float], percentile: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[percentile - 1]
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of the ingest Lambda against local stand-ins for HyP3, S3, SQS and CMR'
+    )
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 5, 10], help='SQS records per invocation')
+    parser.add_argument('--invocations', type=int, default=5, help='Invocations per batch size')
+    parser.add_argument('--job-type', choices=['gunw', 'opera', 'mixed'], default='mixed')
+    parser.add_argument('--opera-products', type=int, default=4, help='Products per OPERA_RTC_S1_SLC job')
+    parser.add_argument('--file-size', type=int, default=1024, help='Size in bytes of each output file')
+    parser.add_argument('--hyp3-latency', type=float, default=0.05, help='Seconds per fake HyP3 API call')
+    parser.add_argument('--cmr-latency', type=float, default=0.1, help='Seconds per fake CMR search')
+    parser.add_argument('--max-record-workers', type=int, default=4)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+
+    print(f'{"batch size":>10} {"messages":>9} {"msgs/sec":>9} {"p50 (s)":>8} {"p99 (s)":>8} {"peak RSS (MB)":>14}')
+    for batch_size in args.batch_sizes:
+        scenario = Scenario(
+            batch_size=batch_size,
+            invocations=args.invocations,
+            job_type=args.job_type,
+            opera_products=args.opera_products,
+            file_size=args.file_size,
+            hyp3_latency=args.hyp3_latency,
+            cmr_latency=args.cmr_latency,
+            max_record_workers=args.max_record_workers,
+        )
+        # Each batch size runs in a fresh process so that peak RSS and warm caches are not shared between them.
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(run_scenario, (scenario,))
+
+        print(
+            f'{batch_size:>10} {result.messages:>9} {result.messages / result.seconds:>9.1f} '
+            f'{_percentile(result.latencies, 50):>8.3f} {_percentile(result.latencies, 99):>8.3f} '
+            f'{result.peak_rss_mb:>14.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
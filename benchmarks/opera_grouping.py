@@ -0,0 +1,48 @@
+import argparse
+import timeit
+from pathlib import Path
+
+import aws
+import opera_rtc_s1_slc
+
+
+FILE_SUFFIXES = ('.h5', '.iso.xml', '_BROWSE.png', '_VV.tif', '_VH.tif', '_mask.tif')
+
+
+def get_listing(products: int) -> list[aws.S3Object]:
+    names = [
+        f'OPERA_L2_RTC-S1_T{index // 1000:03d}-{index % 1000:06d}-IW1_20250813T204041Z_20250813T235131Z_S1A_30_v1.0'
+        for index in range(products)
+    ]
+    keys = sorted(f'myJobId/{name}{suffix}' for name in names for suffix in FILE_SUFFIXES)
+    return [aws.S3Object(key=key, size=1, etag='"foo"') for key in [*keys, 'myJobId/product.log']]
+
+
+def group_by_substring(objects: list[aws.S3Object]) -> dict[str, list[aws.S3Object]]:
+    # The implementation before _group_by_product, for comparison.
+    product_names = {Path(obj.key).stem for obj in objects if obj.key.endswith('.h5')}
+    return {product_name: [obj for obj in objects if product_name in obj.key] for product_name in product_names}
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Compare grouping OPERA_RTC_S1_SLC listings into products')
+    parser.add_argument('--products', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the fastest is reported')
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = get_args()
+
+    print(f'{"products":>8} {"keys":>6} {"substring (ms)":>15} {"index (ms)":>11}')
+    for products in args.products:
+        objects = get_listing(products)
+        assert group_by_substring(objects) == opera_rtc_s1_slc._group_by_product(objects)
+
+        substring = min(timeit.repeat(lambda: group_by_substring(objects), number=1, repeat=args.repeat))
+        index = min(timeit.repeat(lambda: opera_rtc_s1_slc._group_by_product(objects), number=1, repeat=args.repeat))
+        print(f'{products:>8} {len(objects):>6} {substring * 1000:>15.1f} {index * 1000:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
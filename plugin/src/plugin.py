@@ -1,39 +1,134 @@
 import argparse
+import functools
 import json
 import os
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 import boto3
+from botocore.exceptions import BotoCoreError, ClientError
 
+import job_snapshot
 
-def publish(hyp3_url: str, job_id: str, topic_arn: str) -> None:
-    message = {
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+SNS_MAX_BATCH_ENTRIES = 10
+
+
+@functools.cache
+def get_sns_client(region: str) -> 'BaseClient':
+    return boto3.client('sns', region_name=region)
+
+
+def _get_message(hyp3_url: str, job_id: str, snapshot: dict | None = None) -> str:
+    message: dict = {
         'hyp3_url': hyp3_url,
         'job_id': job_id,
     }
+    if snapshot is not None:
+        message['job_snapshot'] = snapshot
+    return json.dumps(message)
+
+
+def publish(hyp3_url: str, job_id: str, topic_arn: str, snapshot: dict | None = None) -> None:
+    region = topic_arn.split(':')[3]
+    sns = get_sns_client(region)
+    sns.publish(TopicArn=topic_arn, Message=_get_message(hyp3_url, job_id, snapshot))
+
+
+def publish_batch(hyp3_url: str, job_ids: list[str], topic_arn: str) -> list[str]:
     region = topic_arn.split(':')[3]
-    sns = boto3.client('sns', region_name=region)
-    sns.publish(TopicArn=topic_arn, Message=json.dumps(message))
+    sns = get_sns_client(region)
+
+    failed_job_ids = []
+    for start in range(0, len(job_ids), SNS_MAX_BATCH_ENTRIES):
+        batch = job_ids[start : start + SNS_MAX_BATCH_ENTRIES]
+        # Job IDs are used as messages, so entry IDs only need to be unique within the batch.
+        entries = [{'Id': str(index), 'Message': _get_message(hyp3_url, job_id)} for index, job_id in enumerate(batch)]
+        try:
+            response = sns.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=entries)
+        except (BotoCoreError, ClientError) as e:
+            print(f'Could not publish jobs {", ".join(batch)}: {e}')
+            failed_job_ids.extend(batch)
+            continue
+
+        for failure in response.get('Failed', []):
+            job_id = batch[int(failure['Id'])]
+            print(f'Could not publish job {job_id}: {failure["Code"]} {failure.get("Message", "")}'.rstrip())
+            failed_job_ids.append(job_id)
+
+    print(f'Published {len(job_ids) - len(failed_job_ids)} of {len(job_ids)} jobs to {topic_arn}')
+    return failed_job_ids
+
+
+def _read_job_ids(job_ids_file: str) -> list[str]:
+    text = sys.stdin.read() if job_ids_file == '-' else Path(job_ids_file).read_text()
+    return [job_id for job_id in text.split() if job_id]
 
 
 def get_args(args: list[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser()
-    parser.add_argument('job_id', type=str)
+    parser.add_argument('job_ids', type=str, nargs='*', metavar='job_id')
+    parser.add_argument(
+        '--job-ids-file',
+        type=str,
+        help='File with one job ID per line, or - to read job IDs from stdin',
+    )
     parser.add_argument('--hyp3-url', type=str, default=os.getenv('HYP3_URL'))
     parser.add_argument('--topic-arn', type=str, default=os.getenv('TOPIC_ARN'))
+    parser.add_argument(
+        '--job-snapshot',
+        type=Path,
+        default=os.getenv('JOB_SNAPSHOT'),
+        help='Path to a JSON file with the HyP3 job, to send along with the job ID',
+    )
+    parser.add_argument(
+        '--job-snapshot-key',
+        type=str,
+        default=os.getenv('JOB_SNAPSHOT_KEY'),
+        help='Key shared with the application to sign the job snapshot with',
+    )
     parsed_args = parser.parse_args(args)
 
+    if parsed_args.job_ids_file is not None:
+        parsed_args.job_ids.extend(_read_job_ids(parsed_args.job_ids_file))
+
+    if not parsed_args.job_ids:
+        parser.error('at least one job ID must be provided as an argument or via --job-ids-file')
+
     if parsed_args.hyp3_url is None:
         raise ValueError('HyP3 URL must be provided via the --hyp3-url option or the HYP3_URL environment variable')
 
     if parsed_args.topic_arn is None:
         raise ValueError('Topic ARN must be provided via the --topic-arn option or the TOPIC_ARN environment variable')
 
+    if parsed_args.job_snapshot is not None and len(parsed_args.job_ids) > 1:
+        raise ValueError('A job snapshot can only be sent with a single job ID')
+
+    if parsed_args.job_snapshot is not None and not parsed_args.job_snapshot_key:
+        raise ValueError(
+            'A job snapshot key must be provided via the --job-snapshot-key option or the JOB_SNAPSHOT_KEY environment '
+            'variable to send a job snapshot'
+        )
+
     return parsed_args
 
 
 def main() -> None:
     args = get_args()
-    publish(args.hyp3_url, args.job_id, args.topic_arn)
+    if len(args.job_ids) == 1:
+        snapshot = None
+        if args.job_snapshot is not None:
+            snapshot = job_snapshot.create(json.loads(args.job_snapshot.read_text()), args.job_snapshot_key)
+        publish(args.hyp3_url, args.job_ids[0], args.topic_arn, snapshot)
+        return
+
+    if failed_job_ids := publish_batch(args.hyp3_url, args.job_ids, args.topic_arn):
+        raise SystemExit(f'Could not publish {len(failed_job_ids)} of {len(args.job_ids)} jobs')
 
 
 if __name__ == '__main__':
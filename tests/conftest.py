@@ -34,3 +34,47 @@ def s3_bucket():
         aws.S3_CLIENT.create_bucket(Bucket=bucket_name, CreateBucketConfiguration=location)
 
         yield bucket_name
+
+
+@pytest.fixture(autouse=True)
+def checksum_cache_path(tmp_path, monkeypatch):
+    import checksum_cache
+
+    path = tmp_path / 'checksum_cache.sqlite3'
+    monkeypatch.setenv('CHECKSUM_CACHE_PATH', str(path))
+    monkeypatch.delenv('CHECKSUM_CACHE_TABLE', raising=False)
+    checksum_cache.get_checksum_cache.cache_clear()
+    yield path
+    checksum_cache.get_checksum_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def ledger_path(tmp_path, monkeypatch):
+    import ledger
+
+    path = tmp_path / 'ledger.sqlite3'
+    monkeypatch.setenv('LEDGER_PATH', str(path))
+    monkeypatch.delenv('LEDGER_TABLE', raising=False)
+    ledger.get_ledger.cache_clear()
+    yield path
+    ledger.get_ledger.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def warm_caches():
+    import util
+
+    util.get_cmr_cache.cache_clear()
+    util.get_recently_sent.cache_clear()
+    yield
+    util.get_cmr_cache.cache_clear()
+    util.get_recently_sent.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def rate_limiters():
+    import ratelimit
+
+    ratelimit.RATE_LIMITERS.clear()
+    yield ratelimit.RATE_LIMITERS
+    ratelimit.RATE_LIMITERS.clear()
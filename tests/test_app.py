@@ -1,11 +1,42 @@
 import datetime
+import hashlib
 import json
-from unittest.mock import MagicMock, call, patch
+import threading
+import time
+from unittest.mock import ANY, MagicMock, call, patch
 
 import hyp3_sdk
 import pytest
+import requests
 
 import app
+import aws
+import job_snapshot
+import ledger
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def hyp3_clients():
+    app.HYP3_CLIENTS.clear()
+    yield app.HYP3_CLIENTS
+    app.HYP3_CLIENTS.clear()
+
+
+@pytest.fixture(autouse=True)
+def credentials_cache():
+    app.CREDENTIALS_CACHE.clear()
+    yield app.CREDENTIALS_CACHE
+    app.CREDENTIALS_CACHE.clear()
+
+
+def get_hyp3_error(status_code, detail, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    error = hyp3_sdk.exceptions.HyP3Error(f'{response} {detail}')
+    error.__context__ = requests.HTTPError(response=response)
+    return error
 
 
 def test_get_job_dict():
@@ -35,7 +66,128 @@ def test_get_job_dict():
         mock_hyp3.get_job_by_id.assert_called_once_with('abc123')
 
 
+def test_get_hyp3_client():
+    with patch('hyp3_sdk.HyP3') as mock_constructor:
+        mock_constructor.side_effect = lambda *args: MagicMock()
+
+        client = app.get_hyp3_client('https://foo.com', 'myUser', 'myPass')
+        assert app.get_hyp3_client('https://foo.com', 'myUser', 'myPass') is client
+
+        other_client = app.get_hyp3_client('https://bar.com', 'myUser', 'myPass')
+        assert other_client is not client
+        assert app.get_hyp3_client('https://bar.com', 'myUser', 'myPass') is other_client
+
+        new_credentials_client = app.get_hyp3_client('https://foo.com', 'myUser', 'newPass')
+        assert new_credentials_client is not client
+        assert app.get_hyp3_client('https://foo.com', 'myUser', 'newPass') is new_credentials_client
+
+        refreshed_client = app.get_hyp3_client('https://foo.com', 'myUser', 'newPass', refresh=True)
+        assert refreshed_client is not new_credentials_client
+        assert app.get_hyp3_client('https://foo.com', 'myUser', 'newPass') is refreshed_client
+
+        assert mock_constructor.mock_calls == [
+            call('https://foo.com', 'myUser', 'myPass'),
+            call('https://bar.com', 'myUser', 'myPass'),
+            call('https://foo.com', 'myUser', 'newPass'),
+            call('https://foo.com', 'myUser', 'newPass'),
+        ]
+
+
+def test_get_job_dict_reads_status_code_from_response():
+    with patch('hyp3_sdk.HyP3') as mock_constructor:
+        mock_constructor.return_value.get_job_by_id.side_effect = hyp3_sdk.exceptions.HyP3Error(
+            '<Response [401]> without a response'
+        )
+        with pytest.raises(hyp3_sdk.exceptions.HyP3Error):
+            app.get_job_dict('https://foo.com', 'myUser', 'myPass', 'abc123')
+        mock_constructor.assert_called_once_with('https://foo.com', 'myUser', 'myPass')
+
+
+def test_get_hyp3_client_logs_in_outside_lock():
+    def mock_constructor(*args):
+        assert not app.HYP3_CLIENTS_LOCK.locked()
+        return MagicMock()
+
+    with patch('hyp3_sdk.HyP3', side_effect=mock_constructor):
+        client = app.get_hyp3_client('https://foo.com', 'myUser', 'myPass')
+    assert app.HYP3_CLIENTS['https://foo.com'] == (('myUser', 'myPass'), client)
+
+
+def test_get_job_dict_reauthenticates():
+    job = hyp3_sdk.jobs.Job(
+        job_type='myJobType',
+        job_id='abc123',
+        request_time=datetime.datetime(2025, 2, 19, 1, 2, 3, 456),
+        status_code='SUCCEEDED',
+        user_id='myUser',
+    )
+
+    with patch('hyp3_sdk.HyP3') as mock_constructor:
+        expired_hyp3 = MagicMock()
+        expired_hyp3.get_job_by_id.side_effect = get_hyp3_error(401, 'Unauthorized')
+        fresh_hyp3 = MagicMock()
+        fresh_hyp3.get_job_by_id.return_value = job
+        mock_constructor.side_effect = [expired_hyp3, fresh_hyp3]
+
+        assert app.get_job_dict('https://foo.com', 'myUser', 'myPass', 'abc123')['job_id'] == 'abc123'
+        assert app.get_job_dict('https://foo.com', 'myUser', 'myPass', 'abc123')['job_id'] == 'abc123'
+        assert mock_constructor.call_count == 2
+        assert fresh_hyp3.get_job_by_id.call_count == 2
+
+    with patch('hyp3_sdk.HyP3') as mock_constructor:
+        app.HYP3_CLIENTS.clear()
+        mock_hyp3 = MagicMock()
+        mock_hyp3.get_job_by_id.side_effect = get_hyp3_error(404, 'Not Found')
+        mock_constructor.return_value = mock_hyp3
+
+        with pytest.raises(hyp3_sdk.exceptions.HyP3Error, match=r'404'):
+            app.get_job_dict('https://foo.com', 'myUser', 'myPass', 'abc123')
+        mock_constructor.assert_called_once_with('https://foo.com', 'myUser', 'myPass')
+
+
+def test_get_job_dict_adapts_to_throttling(monkeypatch):
+    monkeypatch.setenv('HYP3_RATE_LIMIT', '4')
+    job = hyp3_sdk.jobs.Job(
+        job_type='myJobType',
+        job_id='abc123',
+        request_time=datetime.datetime(2025, 2, 19, 1, 2, 3, 456),
+        status_code='SUCCEEDED',
+        user_id='myUser',
+    )
+
+    with patch('hyp3_sdk.HyP3') as mock_constructor, patch('time.sleep') as mock_sleep:
+        mock_hyp3 = MagicMock()
+        mock_hyp3.get_job_by_id.side_effect = [
+            get_hyp3_error(429, 'Too Many Requests', {'Retry-After': '30'}),
+            job,
+        ]
+        mock_constructor.return_value = mock_hyp3
+
+        assert app.get_job_dict('https://foo.com', 'myUser', 'myPass', 'abc123')['job_id'] == 'abc123'
+        assert mock_hyp3.get_job_by_id.call_count == 2
+        rate_limiter = app.get_hyp3_rate_limiter('https://foo.com')
+        assert rate_limiter.rate == pytest.approx(2.1)
+        assert app.get_hyp3_rate_limiter('https://bar.com').rate == 4.0
+        # The retry waits for the Retry-After the HyP3 API asked for.
+        mock_sleep.assert_called_once()
+        assert mock_sleep.call_args.args[0] == pytest.approx(30.0, abs=1.0)
+
+
+def test_get_job_dict_gives_up_when_throttled(monkeypatch):
+    monkeypatch.setenv('HYP3_MAX_RETRIES', '2')
+
+    with patch('hyp3_sdk.HyP3') as mock_constructor, patch('time.sleep'):
+        mock_hyp3 = MagicMock()
+        mock_hyp3.get_job_by_id.side_effect = get_hyp3_error(429, 'Too Many Requests')
+        mock_constructor.return_value = mock_hyp3
+
+        with pytest.raises(hyp3_sdk.exceptions.HyP3Error, match=r'429'):
+            app.get_job_dict('https://foo.com', 'myUser', 'myPass', 'abc123')
+        assert mock_hyp3.get_job_by_id.call_count == 3
+
+
 def test_process_message_aria_s1_gunw():
+    mock_publish = MagicMock()
     job = {'job_type': 'ARIA_S1_GUNW'}
 
     with (
@@ -45,13 +197,15 @@ def test_process_message_aria_s1_gunw():
         app.process_message(
             {'hyp3_url': 'https://foo.com', 'job_id': 'abc123'},
             {'username': 'myUsername', 'password': 'myPassword'},
+            mock_publish,
         )
 
         mock_get_job_dict.assert_called_once_with('https://foo.com', 'myUsername', 'myPassword', 'abc123')
-        mock_process_job.assert_called_once_with(job, 'https://foo.com')
+        mock_process_job.assert_called_once_with(job, 'https://foo.com', mock_publish)
 
 
 def test_process_message_insar_isce():
+    mock_publish = MagicMock()
     job = {'job_type': 'INSAR_ISCE'}
 
     with (
@@ -61,13 +215,15 @@ def test_process_message_insar_isce():
         app.process_message(
             {'hyp3_url': 'https://foo.com', 'job_id': 'abc123'},
             {'username': 'myUsername', 'password': 'myPassword'},
+            mock_publish,
         )
 
         mock_get_job_dict.assert_called_once_with('https://foo.com', 'myUsername', 'myPassword', 'abc123')
-        mock_process_job.assert_called_once_with(job, 'https://foo.com')
+        mock_process_job.assert_called_once_with(job, 'https://foo.com', mock_publish)
 
 
 def test_process_message_aria_raider():
+    mock_publish = MagicMock()
     job = {'job_type': 'ARIA_RAIDER'}
 
     with (
@@ -77,13 +233,15 @@ def test_process_message_aria_raider():
         app.process_message(
             {'hyp3_url': 'https://foo.com', 'job_id': 'abc123'},
             {'username': 'myUsername', 'password': 'myPassword'},
+            mock_publish,
         )
 
         mock_get_job_dict.assert_called_once_with('https://foo.com', 'myUsername', 'myPassword', 'abc123')
-        mock_process_job.assert_called_once_with(job, 'https://foo.com')
+        mock_process_job.assert_called_once_with(job, 'https://foo.com', mock_publish)
 
 
 def test_process_message_opera_rtc_s1_slc():
+    mock_publish = MagicMock()
     job = {'job_type': 'OPERA_RTC_S1_SLC'}
 
     with (
@@ -93,22 +251,88 @@ def test_process_message_opera_rtc_s1_slc():
         app.process_message(
             {'hyp3_url': 'https://foo.com', 'job_id': 'abc123'},
             {'username': 'myUsername', 'password': 'myPassword'},
+            mock_publish,
         )
 
         mock_get_job_dict.assert_called_once_with('https://foo.com', 'myUsername', 'myPassword', 'abc123')
-        mock_process_job.assert_called_once_with(job)
+        mock_process_job.assert_called_once_with(job, mock_publish)
 
 
 def test_process_message_unsupported_job_type():
+    mock_publish = MagicMock()
     with patch('app.get_job_dict', return_value={'job_type': 'BAD_JOB_TYPE'}) as mock_get_job_dict:
         with pytest.raises(ValueError, match=r'^Job type BAD_JOB_TYPE is not supported$'):
             app.process_message(
                 {'hyp3_url': 'https://bar.com', 'job_id': 'def456'},
                 {'username': 'myUsername', 'password': 'myPassword'},
+                mock_publish,
             )
         mock_get_job_dict.assert_called_once_with('https://bar.com', 'myUsername', 'myPassword', 'def456')
 
 
+def test_get_job_from_snapshot():
+    job = {'job_id': 'abc123', 'job_type': 'ARIA_S1_GUNW', 'user_id': 'myUser', 'files': [{'filename': 'foo.nc'}]}
+    snapshot = job_snapshot.create(job, 'myKey')
+
+    assert app.get_job_from_snapshot({'hyp3_url': 'https://foo.com', 'job_id': 'abc123'}, 'myKey') is None
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': snapshot}, 'myKey') == job
+
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': snapshot}, None) is None
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': snapshot}, '') is None
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': snapshot}, 'otherKey') is None
+
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': {**snapshot, 'version': 1}}, 'myKey') is None
+    bad_signature = {**snapshot, 'signature': 'bad'}
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': bad_signature}, 'myKey') is None
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': {**snapshot, 'job': None}}, 'myKey') is None
+
+    tampered = {**snapshot, 'job': {**job, 'user_id': 'otherUser'}}
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': tampered}, 'myKey') is None
+
+    # An unkeyed digest can be recomputed by anyone who can publish to the topic.
+    forged = {
+        'version': job_snapshot.VERSION,
+        'job': tampered['job'],
+        'signature': hashlib.sha256(json.dumps(tampered['job'], sort_keys=True).encode()).hexdigest(),
+    }
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': forged}, 'myKey') is None
+
+    assert app.get_job_from_snapshot({'job_id': 'def456', 'job_snapshot': snapshot}, 'myKey') is None
+
+    incomplete = job_snapshot.create({**job, 'files': []}, 'myKey')
+    assert app.get_job_from_snapshot({'job_id': 'abc123', 'job_snapshot': incomplete}, 'myKey') is None
+
+
+def test_process_message_with_job_snapshot():
+    mock_publish = MagicMock()
+    job = {'job_id': 'abc123', 'job_type': 'ARIA_S1_GUNW', 'user_id': 'myUser', 'files': [{'filename': 'foo.nc'}]}
+    message = {'hyp3_url': 'https://foo.com', 'job_id': 'abc123', 'job_snapshot': job_snapshot.create(job, 'myKey')}
+    edl_credentials = {'username': 'myUsername', 'password': 'myPassword', 'job_snapshot_key': 'myKey'}
+
+    with (
+        patch('app.get_job_dict') as mock_get_job_dict,
+        patch('gunw.process_job') as mock_process_job,
+    ):
+        app.process_message(message, edl_credentials, mock_publish)
+
+        mock_get_job_dict.assert_not_called()
+        mock_process_job.assert_called_once_with(job, 'https://foo.com', mock_publish)
+
+    for credentials in (
+        {'username': 'myUsername', 'password': 'myPassword'},
+        {**edl_credentials, 'job_snapshot_key': ''},
+        {**edl_credentials, 'job_snapshot_key': 'otherKey'},
+    ):
+        with (
+            patch('app.get_job_dict', return_value=job) as mock_get_job_dict,
+            patch('gunw.process_job') as mock_process_job,
+        ):
+            app.process_message(message, credentials, mock_publish)
+
+            mock_get_job_dict.assert_called_once_with('https://foo.com', 'myUsername', 'myPassword', 'abc123')
+            mock_process_job.assert_called_once_with(job, 'https://foo.com', mock_publish)
+
+
 def test_load_credentials(monkeypatch):
     credentials = {'username': 'myUsername', 'password': 'myPassword'}
 
@@ -123,11 +347,217 @@ def test_load_credentials(monkeypatch):
         assert loaded_creds == credentials
 
 
+def test_load_credentials_cache(monkeypatch):
+    with patch('boto3.client') as mock_client, monkeypatch.context() as m:
+        m.setenv('SECRET_ARN', 'arn')
+        m.setenv('CREDENTIALS_TTL', '60')
+
+        mock_secrets_manager = MagicMock()
+        mock_secrets_manager.get_secret_value.side_effect = [
+            {'SecretString': json.dumps({'username': 'user1', 'password': 'pass1'})},
+            {'SecretString': json.dumps({'username': 'user2', 'password': 'pass2'})},
+            {'SecretString': json.dumps({'username': 'user3', 'password': 'pass3'})},
+        ]
+        mock_client.return_value = mock_secrets_manager
+
+        with patch('time.monotonic', return_value=1000):
+            assert app.load_credentials() == {'username': 'user1', 'password': 'pass1'}
+            assert app.load_credentials() == {'username': 'user1', 'password': 'pass1'}
+            assert mock_secrets_manager.get_secret_value.call_count == 1
+
+        with patch('time.monotonic', return_value=1059):
+            assert app.load_credentials() == {'username': 'user1', 'password': 'pass1'}
+            assert app.load_credentials(force_refresh=True) == {'username': 'user2', 'password': 'pass2'}
+            assert mock_secrets_manager.get_secret_value.call_count == 2
+
+        with patch('time.monotonic', return_value=1120):
+            assert app.load_credentials() == {'username': 'user3', 'password': 'pass3'}
+            assert mock_secrets_manager.get_secret_value.call_count == 3
+
+
+def test_lambda_handler_refreshes_credentials(monkeypatch):
+    monkeypatch.setenv('MAX_RECORD_WORKERS', '1')
+    event = {
+        'Records': [
+            {'messageId': 'id1', 'body': json.dumps({'Message': json.dumps({'job_id': 'job1'})})},
+            {'messageId': 'id2', 'body': json.dumps({'Message': json.dumps({'job_id': 'job2'})})},
+        ],
+    }
+    old_credentials = {'username': 'myUsername', 'password': 'oldPassword'}
+    new_credentials = {'username': 'myUsername', 'password': 'newPassword'}
+    cached_credentials = [old_credentials]
+
+    def mock_load_credentials(force_refresh=False):
+        if force_refresh:
+            cached_credentials[0] = new_credentials
+        return cached_credentials[0]
+
+    def mock_process_message(message, edl_credentials, publish):
+        if edl_credentials == old_credentials:
+            raise hyp3_sdk.exceptions.AuthenticationError('Was not able to authenticate')
+
+    with (
+        patch('app.process_message', side_effect=mock_process_message) as mock_process,
+        patch('app.load_credentials', side_effect=mock_load_credentials) as mock_load,
+    ):
+        assert app.lambda_handler(event, None) == {'batchItemFailures': []}
+        assert mock_load.mock_calls == [call(), call(force_refresh=True), call()]
+        assert mock_process.mock_calls == [
+            call({'job_id': 'job1'}, old_credentials, ANY),
+            call({'job_id': 'job1'}, new_credentials, ANY),
+            call({'job_id': 'job2'}, new_credentials, ANY),
+        ]
+
+
+def test_lambda_handler_processes_records_concurrently(monkeypatch):
+    monkeypatch.setenv('MAX_RECORD_WORKERS', '3')
+    event = {
+        'Records': [
+            {'messageId': f'id{i}', 'body': json.dumps({'Message': json.dumps({'job_id': f'job{i}'})})}
+            for i in range(6)
+        ],
+    }
+    barrier = threading.Barrier(3, timeout=5)
+
+    def mock_process_message(message, edl_credentials, publish):
+        # Only returns once three records are being processed at the same time.
+        barrier.wait()
+        if message['job_id'] in ('job1', 'job4'):
+            raise ValueError(f'Could not process {message["job_id"]}')
+
+    with (
+        patch('app.process_message', side_effect=mock_process_message),
+        patch('app.load_credentials', return_value={}),
+    ):
+        assert app.lambda_handler(event, None) == {
+            'batchItemFailures': [{'itemIdentifier': 'id1'}, {'itemIdentifier': 'id4'}],
+        }
+
+
+def test_lambda_handler_returns_unstarted_records_before_deadline(monkeypatch):
+    monkeypatch.setenv('MAX_RECORD_WORKERS', '1')
+    monkeypatch.setenv('RECORD_TIME_ESTIMATE', '0.3')
+    monkeypatch.setenv('DEADLINE_MARGIN_SECONDS', '0')
+    event = {
+        'Records': [
+            {'messageId': f'id{i}', 'body': json.dumps({'Message': json.dumps({'job_id': f'job{i}'})})}
+            for i in range(3)
+        ],
+    }
+    context = MagicMock()
+    context.get_remaining_time_in_millis.return_value = 1000
+
+    with (
+        patch('app.process_message', side_effect=lambda *args: time.sleep(0.4)) as mock_process_message,
+        patch('app.load_credentials', return_value={}),
+    ):
+        assert app.lambda_handler(event, context) == {'batchItemFailures': [{'itemIdentifier': 'id2'}]}
+        assert [c.args[0]['job_id'] for c in mock_process_message.mock_calls] == ['job0', 'job1']
+
+    # The margin is reserved for sending the messages of the records that were started.
+    monkeypatch.setenv('DEADLINE_MARGIN_SECONDS', '0.5')
+    with (
+        patch('app.process_message', side_effect=lambda *args: time.sleep(0.4)) as mock_process_message,
+        patch('app.load_credentials', return_value={}),
+    ):
+        assert app.lambda_handler(event, context) == {
+            'batchItemFailures': [{'itemIdentifier': 'id1'}, {'itemIdentifier': 'id2'}],
+        }
+        assert [c.args[0]['job_id'] for c in mock_process_message.mock_calls] == ['job0']
+
+
+def test_parse_time_estimates():
+    assert app.parse_time_estimates('{"OPERA_RTC_S1_SLC": 20, "ARIA_S1_GUNW": "90.5"}') == {
+        'OPERA_RTC_S1_SLC': 20.0,
+        'ARIA_S1_GUNW': 90.5,
+    }
+    assert app.parse_time_estimates('{}') == {}
+    assert app.parse_time_estimates('foo') == {}
+    assert app.parse_time_estimates('[1, 2]') == {}
+    assert app.parse_time_estimates('{"OPERA_RTC_S1_SLC": "foo"}') == {}
+
+
+def test_get_time_estimate(monkeypatch):
+    def get_record(message):
+        return {'messageId': 'myMessageId', 'body': json.dumps({'Message': json.dumps(message)})}
+
+    snapshot = {'version': 2, 'signature': 'mySignature', 'job': {'job_type': 'OPERA_RTC_S1_SLC'}}
+    assert app.get_time_estimate(get_record({'job_id': 'myJobId'})) == 60.0
+    assert app.get_time_estimate(get_record({'job_id': 'myJobId', 'job_snapshot': snapshot})) == 60.0
+
+    monkeypatch.setenv('RECORD_TIME_ESTIMATE', '90')
+    monkeypatch.setenv('RECORD_TIME_ESTIMATES', json.dumps({'OPERA_RTC_S1_SLC': 20}))
+    assert app.get_time_estimate(get_record({'job_id': 'myJobId'})) == 90.0
+    assert app.get_time_estimate(get_record({'job_id': 'myJobId', 'job_snapshot': snapshot})) == 20.0
+    assert app.get_time_estimate({'messageId': 'myMessageId', 'body': 'foo'}) == 90.0
+
+    monkeypatch.setenv('RECORD_TIME_ESTIMATES', 'foo')
+    assert app.get_time_estimate(get_record({'job_id': 'myJobId', 'job_snapshot': snapshot})) == 90.0
+
+
+def test_process_record_sets_delivery_id():
+    record = {
+        'messageId': 'myMessageId',
+        'body': json.dumps({'MessageId': 'mySnsMessageId', 'Message': json.dumps({'job_id': 'myJobId'})}),
+    }
+    delivery_ids = []
+
+    with (
+        patch('app.process_message', side_effect=lambda *args: delivery_ids.append(ledger.get_delivery_id())),
+        patch('app.load_credentials', return_value={}),
+    ):
+        assert app.process_record(record, aws.IngestMessagePublisher())
+
+    assert delivery_ids == ['mySnsMessageId']
+    assert ledger.get_delivery_id() is None
+
+
+def test_process_record_emits_metrics(capsys):
+    record = {
+        'messageId': 'myMessageId',
+        'body': json.dumps({'Message': json.dumps({'hyp3_url': 'https://foo.com', 'job_id': 'myJobId'})}),
+    }
+    with (
+        patch('app.load_credentials', return_value={'username': 'myUsername', 'password': 'myPassword'}),
+        patch('app.get_job_dict', return_value={'job_type': 'myJobType'}),
+    ):
+        assert not app.process_record(record, aws.IngestMessagePublisher())
+
+    emf = json.loads(capsys.readouterr().out.splitlines()[-1])
+    assert emf['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['job_type']]
+    assert emf['job_type'] == 'myJobType'
+    assert set(emf) == {'_aws', 'job_type', 'credentials', 'hyp3_fetch'}
+
+
+def test_process_record_emits_send_metrics(capsys):
+    record = {
+        'messageId': 'myMessageId',
+        'body': json.dumps({'Message': json.dumps({'hyp3_url': 'https://foo.com', 'job_id': 'myJobId'})}),
+    }
+
+    def mock_process_message(message, edl_credentials, publish):
+        metrics.set_dimensions(job_type='myJobType', collection='myCollection')
+        publish('myQueue', {'identifier': 'product1', 'collection': 'myCollection'})
+
+    with (
+        patch('app.process_message', mock_process_message),
+        patch('app.load_credentials', return_value={}),
+        patch('aws.send_ingest_messages', return_value=[True]),
+    ):
+        assert app.process_record(record, aws.IngestMessagePublisher())
+
+    # Sending the record's messages is reported in the record's document, with its dimensions.
+    documents = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert len(documents) == 1
+    assert documents[0]['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['collection', 'job_type']]
+    assert set(documents[0]) == {'_aws', 'collection', 'job_type', 'credentials', 'sqs_send'}
+
+
 def test_lambda_handler():
     event = {
         'Records': [
-            {'body': '{"Message": "{\\"hyp3_url\\": \\"url1\\", \\"job_id\\": \\"id1\\"}"}'},
-            {'body': '{"Message": "{\\"hyp3_url\\": \\"url2\\", \\"job_id\\": \\"id2\\"}"}'},
+            {'messageId': 'id1', 'body': '{"Message": "{\\"hyp3_url\\": \\"url1\\", \\"job_id\\": \\"id1\\"}"}'},
+            {'messageId': 'id2', 'body': '{"Message": "{\\"hyp3_url\\": \\"url2\\", \\"job_id\\": \\"id2\\"}"}'},
         ],
     }
     credentials = {'username': 'myUsername', 'password': 'myPassword'}
@@ -139,11 +569,11 @@ def test_lambda_handler():
         assert app.lambda_handler(event, None) == {'batchItemFailures': []}
         mock_process_message.assert_has_calls(
             [
-                call({'hyp3_url': 'url1', 'job_id': 'id1'}, credentials),
-                call({'hyp3_url': 'url2', 'job_id': 'id2'}, credentials),
+                call({'hyp3_url': 'url1', 'job_id': 'id1'}, credentials, ANY),
+                call({'hyp3_url': 'url2', 'job_id': 'id2'}, credentials, ANY),
             ],
         )
-        mock_load_credentials.assert_called_once_with()
+        assert mock_load_credentials.mock_calls == [call(), call()]
 
     event = {
         'Records': [
@@ -152,4 +582,40 @@ def test_lambda_handler():
     }
     with patch('app.load_credentials', return_value=credentials) as mock_load_credentials:
         assert app.lambda_handler(event, None) == {'batchItemFailures': [{'itemIdentifier': 'myMessageId'}]}
-        mock_load_credentials.assert_called_once_with()
+        mock_load_credentials.assert_not_called()
+
+
+def test_lambda_handler_publishes_each_record():
+    event = {
+        'Records': [
+            {'messageId': 'id1', 'body': json.dumps({'Message': json.dumps({'job_id': 'job1'})})},
+            {'messageId': 'id2', 'body': json.dumps({'Message': json.dumps({'job_id': 'job2'})})},
+            {'messageId': 'id3', 'body': json.dumps({'Message': json.dumps({'job_id': 'job3'})})},
+        ],
+    }
+
+    def mock_process_message(message, edl_credentials, publish):
+        publish('myQueue', {'identifier': f'{message["job_id"]}-product1', 'collection': 'myCollection'})
+        publish('myQueue', {'identifier': f'{message["job_id"]}-product2', 'collection': 'myCollection'})
+        if message['job_id'] == 'job2':
+            raise ValueError('failed after publishing')
+
+    def mock_send_ingest_messages(queue_url, messages):
+        assert queue_url == 'myQueue'
+        return [message['identifier'] != 'job3-product2' for message in messages]
+
+    with (
+        patch('app.process_message', mock_process_message),
+        patch('app.load_credentials', return_value={}),
+        patch('aws.send_ingest_messages', side_effect=mock_send_ingest_messages) as mock_send,
+        patch('util.get_max_record_workers', return_value=1),
+    ):
+        assert app.lambda_handler(event, None) == {
+            'batchItemFailures': [{'itemIdentifier': 'id2'}, {'itemIdentifier': 'id3'}],
+        }
+
+    # The messages of each record are sent together as soon as the record completes.
+    assert [[message['identifier'] for message in c.args[1]] for c in mock_send.mock_calls] == [
+        ['job1-product1', 'job1-product2'],
+        ['job3-product1', 'job3-product2'],
+    ]
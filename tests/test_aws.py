@@ -1,7 +1,22 @@
+import hashlib
+import io
+import json
+import sqlite3
+from unittest.mock import MagicMock, call, patch
+
 import pytest
+from botocore.response import StreamingBody
 from botocore.stub import Stubber
 
 import aws
+import util
+
+
+@pytest.fixture()
+def s3_stubber():
+    with Stubber(aws.S3_CLIENT) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
 
 
 @pytest.fixture()
@@ -11,50 +26,395 @@ def sqs_stubber():
         stubber.assert_no_pending_responses()
 
 
-def test_publish_message(sqs_stubber):
+def test_md5_for_s3_file_browse(s3_bucket, gunw_data_path):
+    browse_key = 'browse.png'
+    browse = gunw_data_path / browse_key
+    aws.S3_CLIENT.upload_file(str(browse), s3_bucket, browse_key)
+
+    browse_md5 = 'e5094bda56e2316f2ec71d708cf1b4e6'
+    assert aws.md5_for_s3_file(s3_bucket, browse_key) == browse_md5
+    assert aws.md5_for_s3_file(s3_bucket, browse_key, chunk_size=512) == browse_md5
+
+
+def test_md5_for_s3_file_metadata(s3_bucket, gunw_data_path):
+    metadata_key = 'metadata.json'
+    metadata = gunw_data_path / metadata_key
+    aws.S3_CLIENT.upload_file(str(metadata), s3_bucket, metadata_key)
+
+    metadata_md5 = '3b938e3797b8d5a90728ff64f7209752'
+    assert aws.md5_for_s3_file(s3_bucket, metadata_key) == metadata_md5
+    assert aws.md5_for_s3_file(s3_bucket, metadata_key, chunk_size=1024) == metadata_md5
+
+
+def test_md5_for_s3_file_chunk_size(s3_bucket, monkeypatch):
+    aws.S3_CLIENT.put_object(Bucket=s3_bucket, Key='foo', Body=b'0123456789')
+    monkeypatch.setenv('HASH_CHUNK_SIZE', '3')
+
+    with patch.object(StreamingBody, 'iter_chunks', autospec=True, side_effect=StreamingBody.iter_chunks) as mock_iter:
+        assert aws.md5_for_s3_file(s3_bucket, 'foo') == hashlib.md5(b'0123456789').hexdigest()
+        assert mock_iter.call_args.args[1] == 3
+
+
+def test_get_checksum_does_not_trust_listed_etag(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={
+            'ETag': '"3b938e3797b8d5a90728ff64f7209752"',
+            'ServerSideEncryption': 'aws:kms',
+            'ChecksumSHA1': 'qUqP5cyxm6YcTAhz05Hph5gvu9M=',
+        },
+    )
+    expected = aws.Checksum('a94a8fe5ccb19ba61c4c0873d391e987982fbbd3', 'sha1')
+
+    assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752"', 4) == expected
+    assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752"', 4) == expected
+
+
+def test_get_checksum_from_head_object_etag(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={'ETag': '"3b938e3797b8d5a90728ff64f7209752"', 'ServerSideEncryption': 'AES256'},
+    )
+    assert aws.get_checksum('myBucket', 'foo.nc') == aws.Checksum('3b938e3797b8d5a90728ff64f7209752', 'md5')
+
+
+def test_get_checksum_from_native_checksum(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={
+            'ETag': '"3b938e3797b8d5a90728ff64f7209752-2"',
+            'ChecksumSHA256': 'n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg=',
+            'ChecksumType': 'FULL_OBJECT',
+        },
+    )
+    assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752-2"') == aws.Checksum(
+        '9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08', 'sha256'
+    )
+
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={
+            'ETag': '"3b938e3797b8d5a90728ff64f7209752"',
+            'ServerSideEncryption': 'aws:kms',
+            'ChecksumSHA1': 'qUqP5cyxm6YcTAhz05Hph5gvu9M=',
+        },
+    )
+    assert aws.get_checksum('myBucket', 'foo.nc') == aws.Checksum('a94a8fe5ccb19ba61c4c0873d391e987982fbbd3', 'sha1')
+
+
+def test_get_checksum_falls_back_to_download(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={
+            'ETag': '"3b938e3797b8d5a90728ff64f7209752-2"',
+            'ChecksumSHA256': 'n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg=-2',
+            'ChecksumType': 'COMPOSITE',
+            'ChecksumCRC32': 'AAAAAA==',
+        },
+    )
+    s3_stubber.add_response(
+        method='get_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc'},
+        service_response={'Body': StreamingBody(io.BytesIO(b'test'), 4)},
+    )
+    assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752-2"') == aws.Checksum(
+        '098f6bcd4621d373cade4e832627b4f6', 'md5'
+    )
+
+
+def test_get_checksums(s3_bucket, gunw_data_path):
+    aws.S3_CLIENT.upload_file(str(gunw_data_path / 'browse.png'), s3_bucket, 'browse.png')
+    aws.S3_CLIENT.upload_file(str(gunw_data_path / 'metadata.json'), s3_bucket, 'metadata.json')
+    aws.S3_CLIENT.upload_file(str(gunw_data_path / 'data.nc'), s3_bucket, 'data.nc')
+
+    objects = [
+        aws.S3Object(key='metadata.json', size=2675, etag='"0123456789abcdef0123456789abcdef-2"'),
+        aws.S3Object(key='data.nc', size=0, etag='"0123456789abcdef0123456789abcdef-3"'),
+        aws.S3Object(key='browse.png', size=737869, etag='"0123456789abcdef0123456789abcdef"'),
+    ]
+    expected = [
+        aws.Checksum('3b938e3797b8d5a90728ff64f7209752', 'md5'),
+        aws.Checksum('d41d8cd98f00b204e9800998ecf8427e', 'md5'),
+        aws.Checksum('e5094bda56e2316f2ec71d708cf1b4e6', 'md5'),
+    ]
+    assert aws.get_checksums(s3_bucket, objects) == expected
+    assert aws.get_checksums(s3_bucket, objects, max_workers=1) == expected
+    assert aws.get_checksums(s3_bucket, []) == []
+
+
+def test_get_checksums_missing_object(s3_bucket, gunw_data_path):
+    aws.S3_CLIENT.upload_file(str(gunw_data_path / 'browse.png'), s3_bucket, 'browse.png')
+
+    objects = [
+        aws.S3Object(key='browse.png', size=737869, etag='"0123456789abcdef0123456789abcdef-2"'),
+        aws.S3Object(key='missing.nc', size=0, etag='"0123456789abcdef0123456789abcdef-2"'),
+    ]
+    with pytest.raises(aws.S3_CLIENT.exceptions.ClientError):
+        aws.get_checksums(s3_bucket, objects)
+
+
+def test_list_objects_for_job(s3_stubber):
+    s3_stubber.add_response(
+        method='list_objects_v2',
+        expected_params={'Bucket': 'myBucket', 'Prefix': 'myJobId'},
+        service_response={
+            'Contents': [
+                {'Key': 'myJobId/a.h5', 'Size': 1, 'ETag': '"a"', 'StorageClass': 'STANDARD'},
+                {'Key': 'myJobId/b.h5', 'Size': 2, 'ETag': '"b"', 'StorageClass': 'STANDARD'},
+            ],
+            'IsTruncated': True,
+            'NextContinuationToken': 'myToken',
+        },
+    )
+    s3_stubber.add_response(
+        method='list_objects_v2',
+        expected_params={'Bucket': 'myBucket', 'Prefix': 'myJobId', 'ContinuationToken': 'myToken'},
+        service_response={
+            'Contents': [
+                {'Key': 'myJobId/c.h5', 'Size': 3, 'ETag': '"c"', 'StorageClass': 'STANDARD'},
+            ],
+            'IsTruncated': False,
+        },
+    )
+
+    objects = aws.list_objects_for_job('myBucket', 'myJobId')
+    assert next(objects) == aws.S3Object(key='myJobId/a.h5', size=1, etag='"a"')
+    assert list(objects) == [
+        aws.S3Object(key='myJobId/b.h5', size=2, etag='"b"'),
+        aws.S3Object(key='myJobId/c.h5', size=3, etag='"c"'),
+    ]
+
+
+def test_list_objects_for_job_empty(s3_bucket):
+    assert list(aws.list_objects_for_job(s3_bucket, 'myJobId')) == []
+
+
+def test_get_checksum_uses_cache(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={
+            'ETag': '"3b938e3797b8d5a90728ff64f7209752-2"',
+            'ChecksumSHA256': 'n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg=',
+            'ChecksumType': 'FULL_OBJECT',
+        },
+    )
+    expected = aws.Checksum('9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08', 'sha256')
+
+    assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752-2"', 4) == expected
+    assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752-2"', 4) == expected
+
+
+def test_get_checksum_ignores_cache_errors(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={'ETag': '"3b938e3797b8d5a90728ff64f7209752"'},
+    )
+    mock_cache = MagicMock()
+    mock_cache.get.side_effect = sqlite3.OperationalError('database is locked')
+    mock_cache.put.side_effect = sqlite3.OperationalError('database is locked')
+
+    with patch('checksum_cache.get_checksum_cache', return_value=mock_cache):
+        assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752"', 4) == aws.Checksum(
+            '3b938e3797b8d5a90728ff64f7209752', 'md5'
+        )
+    mock_cache.put.assert_called_once()
+
+
+def test_get_checksum_ignores_cache_setup_errors(s3_stubber):
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={'Bucket': 'myBucket', 'Key': 'foo.nc', 'ChecksumMode': 'ENABLED'},
+        service_response={'ETag': '"3b938e3797b8d5a90728ff64f7209752"'},
+    )
+
+    with patch('checksum_cache.get_checksum_cache', side_effect=sqlite3.OperationalError('unable to open database')):
+        assert aws.get_checksum('myBucket', 'foo.nc', '"3b938e3797b8d5a90728ff64f7209752"', 4) == aws.Checksum(
+            '3b938e3797b8d5a90728ff64f7209752', 'md5'
+        )
+
+
+def test_send_ingest_messages(sqs_stubber):
+    messages = [{'identifier': f'product{i}'} for i in range(12)]
+    sqs_stubber.add_response(
+        method='send_message_batch',
+        expected_params={
+            'QueueUrl': 'myQueue',
+            'Entries': [{'Id': str(i), 'MessageBody': f'{{"identifier":"product{i}"}}'} for i in range(10)],
+        },
+        service_response={
+            'Successful': [{'Id': str(i), 'MessageId': 'a', 'MD5OfMessageBody': 'b'} for i in range(8)],
+            'Failed': [
+                {'Id': '8', 'SenderFault': False, 'Code': 'InternalError'},
+                {'Id': '9', 'SenderFault': True, 'Code': 'InvalidMessageContents'},
+            ],
+        },
+    )
     sqs_stubber.add_response(
-        method='send_message',
+        method='send_message_batch',
+        expected_params={
+            'QueueUrl': 'myQueue',
+            'Entries': [{'Id': str(i), 'MessageBody': f'{{"identifier":"product{i}"}}'} for i in (10, 11)],
+        },
+        service_response={
+            'Successful': [{'Id': '10', 'MessageId': 'a', 'MD5OfMessageBody': 'b'}],
+            'Failed': [{'Id': '11', 'SenderFault': False, 'Code': 'InternalError'}],
+        },
+    )
+    sqs_stubber.add_client_error(
+        method='send_message_batch',
+        service_error_code='ServiceUnavailable',
         expected_params={
             'QueueUrl': 'myQueue',
-            'MessageBody': '{"identifier": "foo"}',
+            'Entries': [{'Id': str(i), 'MessageBody': f'{{"identifier":"product{i}"}}'} for i in (8, 11)],
         },
-        service_response={},
     )
     sqs_stubber.add_response(
-        method='send_message',
+        method='send_message_batch',
         expected_params={
             'QueueUrl': 'myQueue',
-            'MessageBody': '{"identifier": "bar"}',
+            'Entries': [{'Id': str(i), 'MessageBody': f'{{"identifier":"product{i}"}}'} for i in (8, 11)],
+        },
+        service_response={
+            'Successful': [{'Id': '8', 'MessageId': 'a', 'MD5OfMessageBody': 'b'}],
+            'Failed': [{'Id': '11', 'SenderFault': False, 'Code': 'InternalError'}],
         },
-        service_response={},
     )
 
-    aws.send_ingest_message(
-        queue_url='myQueue',
-        message={'identifier': 'foo'},  # type: ignore[typeddict-item]
+    with patch('random.uniform', side_effect=lambda low, high: high), patch('time.sleep') as mock_sleep:
+        assert aws.send_ingest_messages('myQueue', messages) == [True] * 9 + [False, True, False]  # type: ignore[arg-type]
+    assert mock_sleep.mock_calls == [call(0.2), call(0.4)]
+
+
+def test_send_ingest_messages_payload_limit(sqs_stubber, monkeypatch):
+    monkeypatch.setattr(aws, 'SQS_MAX_BATCH_BYTES', 50)
+    messages = [{'identifier': 'a' * 10}, {'identifier': 'b' * 10}, {'identifier': 'c' * 40}, {'identifier': 'd'}]
+
+    for entries in ([('0', 'a' * 10)], [('1', 'b' * 10), ('3', 'd')]):
+        sqs_stubber.add_response(
+            method='send_message_batch',
+            expected_params={
+                'QueueUrl': 'myQueue',
+                'Entries': [
+                    {'Id': entry_id, 'MessageBody': f'{{"identifier":"{identifier}"}}'}
+                    for entry_id, identifier in entries
+                ],
+            },
+            service_response={
+                'Successful': [{'Id': entry_id, 'MessageId': 'a', 'MD5OfMessageBody': 'b'} for entry_id, _ in entries],
+                'Failed': [],
+            },
+        )
+
+    assert aws.send_ingest_messages('myQueue', messages) == [True, True, False, True]  # type: ignore[arg-type]
+
+
+def test_send_ingest_messages_claim_check(sqs_stubber, s3_bucket, monkeypatch):
+    monkeypatch.setattr(aws, 'SQS_MAX_BATCH_BYTES', 250)
+    monkeypatch.setenv('CLAIM_CHECK_BUCKET', s3_bucket)
+    small = {'identifier': 'small', 'collection': 'myCollection'}
+    large = {'identifier': 'large', 'collection': 'myCollection', 'product': {'name': 'x' * 400}}
+    large_body = json.dumps(large, separators=(',', ':'))
+
+    sqs_stubber.add_response(
+        method='send_message_batch',
+        expected_params={
+            'QueueUrl': 'myQueue',
+            'Entries': [
+                {'Id': '0', 'MessageBody': '{"identifier":"small","collection":"myCollection"}'},
+                {
+                    'Id': '1',
+                    'MessageBody': '["software.amazon.payloadoffloading.PayloadS3Pointer",'
+                    '{"s3BucketName":"myBucket","s3Key":"myCollection/large/myUuid.json"}]',
+                    'MessageAttributes': {
+                        'ExtendedPayloadSize': {'DataType': 'Number', 'StringValue': str(len(large_body))},
+                    },
+                },
+            ],
+        },
+        service_response={
+            'Successful': [{'Id': str(i), 'MessageId': 'a', 'MD5OfMessageBody': 'b'} for i in range(2)],
+            'Failed': [],
+        },
     )
 
-    aws.send_ingest_message(
-        queue_url='myQueue',
-        message={'identifier': 'bar'},  # type: ignore[typeddict-item]
+    with patch('uuid.uuid4', return_value='myUuid'):
+        assert aws.send_ingest_messages('myQueue', [small, large]) == [True, True]  # type: ignore[list-item]
+
+    response = aws.S3_CLIENT.get_object(Bucket=s3_bucket, Key='myCollection/large/myUuid.json')
+    assert response['Body'].read().decode() == large_body
+    assert response['ContentType'] == 'application/json'
+
+    monkeypatch.setenv('CLAIM_CHECK_BUCKET', 'missingBucket')
+    assert aws.send_ingest_messages('myQueue', [large]) == [False]  # type: ignore[list-item]
+
+
+def test_ingest_message_publisher():
+    foo, bar, baz, qux, quux = (
+        {'identifier': identifier, 'collection': 'myCollection'} for identifier in ('foo', 'bar', 'baz', 'qux', 'quux')
     )
+    publisher = aws.IngestMessagePublisher()
+    publisher.publish('queue1', foo, tag='record1')  # type: ignore[arg-type]
+    publisher.publish('queue2', bar, tag='record1')  # type: ignore[arg-type]
+    publisher.publish('queue1', baz, tag='record2')  # type: ignore[arg-type]
+    publisher.publish('queue1', qux, tag='record3')  # type: ignore[arg-type]
+    publisher.publish('queue2', quux, tag='record3')  # type: ignore[arg-type]
+    publisher.discard('record2')
 
+    def mock_send_ingest_messages(queue_url, messages):
+        results = {
+            'queue1': {'foo': True, 'qux': True},
+            'queue2': {'bar': True, 'quux': False},
+        }
+        return [results[queue_url][message['identifier']] for message in messages]
 
-def test_md5_for_s3_file_browse(s3_bucket, gunw_data_path):
-    browse_key = 'browse.png'
-    browse = gunw_data_path / browse_key
-    aws.S3_CLIENT.upload_file(str(browse), s3_bucket, browse_key)
+    with patch('aws.send_ingest_messages', side_effect=mock_send_ingest_messages) as mock_send:
+        assert publisher.flush() == {'record3'}
+        assert mock_send.mock_calls == [call('queue1', [foo, qux]), call('queue2', [bar, quux])]
 
-    browse_md5 = 'e5094bda56e2316f2ec71d708cf1b4e6'
-    assert aws.md5_for_s3_file(s3_bucket, browse_key) == browse_md5
-    assert aws.md5_for_s3_file(s3_bucket, browse_key, chunk_size=512) == browse_md5
+    assert util.was_recently_sent('myCollection', 'foo')
+    assert not util.was_recently_sent('myCollection', 'baz')
+    assert not util.was_recently_sent('myCollection', 'quux')
 
+    with patch('aws.send_ingest_messages') as mock_send:
+        assert publisher.flush() == set()
+        mock_send.assert_not_called()
 
-def test_md5_for_s3_file_metadata(s3_bucket, gunw_data_path):
-    metadata_key = 'metadata.json'
-    metadata = gunw_data_path / metadata_key
-    aws.S3_CLIENT.upload_file(str(metadata), s3_bucket, metadata_key)
 
-    metadata_md5 = '3b938e3797b8d5a90728ff64f7209752'
-    assert aws.md5_for_s3_file(s3_bucket, metadata_key) == metadata_md5
-    assert aws.md5_for_s3_file(s3_bucket, metadata_key, chunk_size=1024) == metadata_md5
+def test_ingest_message_publisher_flush_tag():
+    foo, bar, baz = ({'identifier': identifier, 'collection': 'myCollection'} for identifier in ('foo', 'bar', 'baz'))
+    publisher = aws.IngestMessagePublisher()
+    publisher.publish('queue1', foo, tag='record1')  # type: ignore[arg-type]
+    publisher.publish('queue2', bar, tag='record2')  # type: ignore[arg-type]
+    publisher.publish('queue1', baz, tag='record1')  # type: ignore[arg-type]
+
+    with patch('aws.send_ingest_messages', side_effect=lambda queue_url, messages: [True] * len(messages)) as mock_send:
+        assert publisher.flush('record1') == set()
+        assert mock_send.mock_calls == [call('queue1', [foo, baz])]
+
+    with patch('aws.send_ingest_messages', return_value=[False]) as mock_send:
+        assert publisher.flush() == {'record2'}
+        assert mock_send.mock_calls == [call('queue2', [bar])]
+
+
+def test_ingest_message_publisher_on_sent():
+    foo, bar, baz = ({'identifier': identifier, 'collection': 'myCollection'} for identifier in ('foo', 'bar', 'baz'))
+    on_sent = {identifier: MagicMock() for identifier in ('foo', 'bar', 'baz')}
+    on_sent['baz'].side_effect = RuntimeError('Could not record')
+
+    publisher = aws.IngestMessagePublisher()
+    for message in (foo, bar, baz):
+        publisher.publish('queue1', message, on_sent=on_sent[message['identifier']], tag='record1')  # type: ignore[arg-type]
+
+    with patch('aws.send_ingest_messages', return_value=[True, False, True]):
+        assert publisher.flush() == {'record1'}
+
+    on_sent['foo'].assert_called_once_with()
+    on_sent['bar'].assert_not_called()
+    on_sent['baz'].assert_called_once_with()
@@ -0,0 +1,162 @@
+import datetime
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import backfill
+
+
+def test_checkpoint(tmp_path):
+    path = tmp_path / 'checkpoint.txt'
+    checkpoint = backfill.Checkpoint(path)
+    assert 'job1' not in checkpoint
+
+    checkpoint.add('job1')
+    checkpoint.add('job2')
+    assert 'job1' in checkpoint
+    assert path.read_text() == 'job1\njob2\n'
+
+    resumed = backfill.Checkpoint(path)
+    assert resumed.job_ids == {'job1', 'job2'}
+
+    in_memory = backfill.Checkpoint(None)
+    in_memory.add('job1')
+    assert 'job1' in in_memory
+
+
+def test_read_job_ids(tmp_path):
+    path = tmp_path / 'job_ids.txt'
+    path.write_text('job1\n\n  job2  \njob3')
+    assert list(backfill.read_job_ids(path)) == [('job1', None), ('job2', None), ('job3', None)]
+
+
+def test_find_jobs():
+    jobs = [MagicMock(job_id='job1'), MagicMock(job_id='job2')]
+    jobs[0].to_dict.return_value = {'job_id': 'job1'}
+    jobs[1].to_dict.return_value = {'job_id': 'job2'}
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+
+    with patch('app.get_hyp3_client') as mock_get_hyp3_client:
+        mock_get_hyp3_client.return_value.find_jobs.return_value = jobs
+        assert list(
+            backfill.find_jobs(
+                'https://foo.com', {'username': 'user', 'password': 'pass'}, 'OPERA_RTC_S1_SLC', start, None, None
+            )
+        ) == [('job1', {'job_id': 'job1'}), ('job2', {'job_id': 'job2'})]
+
+    mock_get_hyp3_client.assert_called_once_with('https://foo.com', 'user', 'pass')
+    mock_get_hyp3_client.return_value.find_jobs.assert_called_once_with(
+        start=start, end=None, status_code='SUCCEEDED', job_type='OPERA_RTC_S1_SLC', user_id=None
+    )
+
+
+def test_backfill(tmp_path):
+    checkpoint = backfill.Checkpoint(tmp_path / 'checkpoint.txt')
+    checkpoint.add('job1')
+    credentials = {'username': 'user', 'password': 'pass'}
+    jobs = [('job1', None), ('job2', None), ('job3', {'job_id': 'job3', 'job_type': 'myJobType'}), ('job4', None)]
+
+    def mock_process_message(message, edl_credentials, publish):
+        assert edl_credentials == credentials
+        if message['job_id'] == 'job4':
+            raise ValueError('job4 failed')
+        publish('myQueue', {'identifier': message['job_id'], 'collection': 'myCollection'})
+
+    def mock_process_job(job, hyp3_url, publish):
+        assert hyp3_url == 'https://foo.com'
+        publish('myQueue', {'identifier': job['job_id'], 'collection': 'myCollection'})
+
+    with (
+        patch('app.process_message', side_effect=mock_process_message) as mock_process,
+        patch('app.process_job', side_effect=mock_process_job),
+        patch('aws.send_ingest_messages', return_value=[True]) as mock_send,
+    ):
+        counts = backfill.backfill('https://foo.com', iter(jobs), credentials, checkpoint, workers=2)
+
+    assert counts == {'succeeded': 2, 'failed': 1, 'skipped': 1}
+    assert sorted(c.args[0]['job_id'] for c in mock_process.mock_calls) == ['job2', 'job4']
+    assert sorted(c.args[1][0]['identifier'] for c in mock_send.mock_calls) == ['job2', 'job3']
+    assert checkpoint.job_ids == {'job1', 'job2', 'job3'}
+
+
+def test_backfill_unpublished_messages(tmp_path):
+    checkpoint = backfill.Checkpoint(tmp_path / 'checkpoint.txt')
+
+    def mock_process_message(message, edl_credentials, publish):
+        publish('myQueue', {'identifier': message['job_id'], 'collection': 'myCollection'})
+
+    with (
+        patch('app.process_message', side_effect=mock_process_message),
+        patch('aws.send_ingest_messages', return_value=[False]),
+    ):
+        counts = backfill.backfill('https://foo.com', iter([('job1', None)]), {}, checkpoint, workers=1)
+
+    assert counts == {'succeeded': 0, 'failed': 1, 'skipped': 0}
+    assert 'job1' not in checkpoint
+
+
+def test_backfill_dry_run(tmp_path, capsys):
+    checkpoint = backfill.Checkpoint(tmp_path / 'checkpoint.txt')
+
+    def mock_process_message(message, edl_credentials, publish):
+        publish('myQueue', {'identifier': message['job_id'], 'collection': 'myCollection'})
+
+    with (
+        patch('app.process_message', side_effect=mock_process_message),
+        patch('aws.send_ingest_messages') as mock_send,
+    ):
+        counts = backfill.backfill('https://foo.com', iter([('job1', None)]), {}, checkpoint, workers=1, dry_run=True)
+
+    assert counts == {'succeeded': 1, 'failed': 0, 'skipped': 0}
+    mock_send.assert_not_called()
+    assert 'job1' not in checkpoint
+    assert json.loads(capsys.readouterr().out) == {
+        'queue_url': 'myQueue',
+        'message': {'identifier': 'job1', 'collection': 'myCollection'},
+    }
+
+
+def test_get_args(tmp_path, monkeypatch):
+    monkeypatch.delenv('HYP3_URL', raising=False)
+    monkeypatch.delenv('EARTHDATA_USERNAME', raising=False)
+    monkeypatch.delenv('EARTHDATA_PASSWORD', raising=False)
+
+    args = backfill.get_args(['--hyp3-url', 'https://foo.com', '--job-ids-file', 'job_ids.txt', '--dry-run'])
+    assert args.job_ids_file.name == 'job_ids.txt'
+    assert args.job_type is None
+    assert args.dry_run
+    assert args.checkpoint is None
+    assert args.username is None
+
+    monkeypatch.setenv('HYP3_URL', 'https://bar.com')
+    args = backfill.get_args(
+        ['--job-type', 'OPERA_RTC_S1_SLC', '--start', '2025-01-01T00:00:00Z', '--workers', '8', '--rate', '2.5']
+    )
+    assert args.hyp3_url == 'https://bar.com'
+    assert args.start == datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    assert args.end is None
+    assert args.workers == 8
+    assert args.rate == 2.5
+
+    with pytest.raises(SystemExit):
+        backfill.get_args(['--job-ids-file', 'job_ids.txt', '--job-type', 'OPERA_RTC_S1_SLC'])
+
+    monkeypatch.delenv('HYP3_URL')
+    with pytest.raises(ValueError, match='HyP3 URL must be provided'):
+        backfill.get_args(['--job-type', 'OPERA_RTC_S1_SLC'])
+
+
+def test_backfill_rate(tmp_path):
+    checkpoint = backfill.Checkpoint(tmp_path / 'checkpoint.txt')
+    jobs = [(f'job{i}', None) for i in range(3)]
+
+    with (
+        patch('app.process_message'),
+        patch('ratelimit.AdaptiveRateLimiter.acquire') as mock_acquire,
+    ):
+        backfill.backfill('https://foo.com', iter(jobs), {}, checkpoint, workers=2)
+        mock_acquire.assert_not_called()
+
+        backfill.backfill('https://foo.com', iter(jobs), {}, backfill.Checkpoint(None), workers=2, rate=2.5)
+        assert mock_acquire.call_count == 3
@@ -0,0 +1,109 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+import checksum_cache
+
+
+@pytest.fixture()
+def dynamodb_cache():
+    cache = checksum_cache.DynamoDbChecksumCache('myTable', ttl_seconds=60)
+    with Stubber(cache.client) as stubber:
+        yield cache, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_sqlite_checksum_cache(tmp_path):
+    cache = checksum_cache.SqliteChecksumCache(str(tmp_path / 'cache.sqlite3'), ttl_seconds=60)
+
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) is None
+
+    cache.put('myBucket', 'foo.nc', '"abc-2"', 10, ('0123', 'md5'))
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) == ('0123', 'md5')
+    assert cache.get('myBucket', 'foo.nc', '"abc-3"', 10) is None
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 11) is None
+    assert cache.get('myBucket', 'bar.nc', '"abc-2"', 10) is None
+    assert cache.get('otherBucket', 'foo.nc', '"abc-2"', 10) is None
+
+    cache.put('myBucket', 'foo.nc', '"abc-2"', 10, ('4567', 'sha256'))
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) == ('4567', 'sha256')
+
+    reopened = checksum_cache.SqliteChecksumCache(str(tmp_path / 'cache.sqlite3'), ttl_seconds=60)
+    assert reopened.get('myBucket', 'foo.nc', '"abc-2"', 10) == ('4567', 'sha256')
+
+
+def test_sqlite_checksum_cache_expiration(tmp_path):
+    cache = checksum_cache.SqliteChecksumCache(str(tmp_path / 'cache.sqlite3'), ttl_seconds=60)
+    cache.put('myBucket', 'foo.nc', '"abc-2"', 10, ('0123', 'md5'))
+
+    with patch('time.time', return_value=time.time() + 61):
+        assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) is None
+
+
+def test_dynamodb_checksum_cache(dynamodb_cache):
+    cache, stubber = dynamodb_cache
+    key = {'cache_key': {'S': 's3://myBucket/foo.nc#"abc-2"#10'}}
+
+    stubber.add_response('get_item', {}, {'TableName': 'myTable', 'Key': key})
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) is None
+
+    stubber.add_response(
+        'put_item',
+        {},
+        {
+            'TableName': 'myTable',
+            'Item': {**key, 'checksum': {'S': '0123'}, 'checksum_type': {'S': 'md5'}, 'expires_at': ANY},
+        },
+    )
+    cache.put('myBucket', 'foo.nc', '"abc-2"', 10, ('0123', 'md5'))
+
+    item = {**key, 'checksum': {'S': '0123'}, 'checksum_type': {'S': 'md5'}}
+    stubber.add_response(
+        'get_item',
+        {'Item': {**item, 'expires_at': {'N': str(int(time.time() + 60))}}},
+        {'TableName': 'myTable', 'Key': key},
+    )
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) == ('0123', 'md5')
+
+    stubber.add_response(
+        'get_item',
+        {'Item': {**item, 'expires_at': {'N': str(int(time.time() - 1))}}},
+        {'TableName': 'myTable', 'Key': key},
+    )
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) is None
+
+
+def test_tiered_checksum_cache(tmp_path):
+    fast = checksum_cache.SqliteChecksumCache(str(tmp_path / 'fast.sqlite3'))
+    slow = checksum_cache.SqliteChecksumCache(str(tmp_path / 'slow.sqlite3'))
+    cache = checksum_cache.TieredChecksumCache([fast, slow])
+
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) is None
+
+    slow.put('myBucket', 'foo.nc', '"abc-2"', 10, ('0123', 'md5'))
+    assert cache.get('myBucket', 'foo.nc', '"abc-2"', 10) == ('0123', 'md5')
+    assert fast.get('myBucket', 'foo.nc', '"abc-2"', 10) == ('0123', 'md5')
+
+    cache.put('myBucket', 'bar.nc', '"def-3"', 20, ('4567', 'sha256'))
+    assert fast.get('myBucket', 'bar.nc', '"def-3"', 20) == ('4567', 'sha256')
+    assert slow.get('myBucket', 'bar.nc', '"def-3"', 20) == ('4567', 'sha256')
+
+
+def test_get_checksum_cache(checksum_cache_path, monkeypatch):
+    cache = checksum_cache.get_checksum_cache()
+    assert isinstance(cache, checksum_cache.SqliteChecksumCache)
+    assert cache.path == str(checksum_cache_path)
+    assert checksum_cache.get_checksum_cache() is cache
+
+    checksum_cache.get_checksum_cache.cache_clear()
+    monkeypatch.setenv('CHECKSUM_CACHE_TABLE', 'myTable')
+    monkeypatch.setenv('CHECKSUM_CACHE_TTL', '60')
+    cache = checksum_cache.get_checksum_cache()
+    assert isinstance(cache, checksum_cache.TieredChecksumCache)
+    sqlite_cache, dynamodb_cache = cache.caches
+    assert isinstance(sqlite_cache, checksum_cache.SqliteChecksumCache)
+    assert isinstance(dynamodb_cache, checksum_cache.DynamoDbChecksumCache)
+    assert dynamodb_cache.table_name == 'myTable'
+    assert dynamodb_cache.ttl_seconds == 60
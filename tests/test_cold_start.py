@@ -0,0 +1,24 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+APP_SRC = Path(__file__).parents[1] / 'app' / 'src'
+
+# Modules that are only needed once a record is processed and are too slow to import during a cold start.
+DEFERRED_MODULES = ('boto3', 'botocore', 'hyp3_sdk', 'requests', 'gunw', 'opera_rtc_s1_slc')
+
+
+def test_import_app_defers_heavy_modules():
+    # A fresh interpreter, since the test session has already imported all of these.
+    result = subprocess.run(
+        [sys.executable, '-c', 'import sys, app; print(" ".join(sys.modules))'],
+        env={**os.environ, 'PYTHONPATH': str(APP_SRC)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = set(result.stdout.split())
+    assert 'app' in modules
+    assert not modules.intersection(DEFERRED_MODULES)
@@ -0,0 +1,36 @@
+import pytest
+
+import collection
+
+
+def test_get_file_type():
+    my_collection = collection.Collection(
+        short_name='myCollection',
+        data_version='1',
+        file_types={'.xml': 'metadata', '.iso.xml': 'browse', '.tar.gz.md5': 'data'},
+        granule_ur_pattern=lambda granule_ur: granule_ur,
+    )
+    assert my_collection.suffix_table == {
+        '.xml': [('.iso.xml', 'browse'), ('.xml', 'metadata')],
+        '.md5': [('.tar.gz.md5', 'data')],
+    }
+
+    assert my_collection.get_file_type('myJobId/foo.xml') == 'metadata'
+    assert my_collection.get_file_type('myJobId/foo.iso.xml') == 'browse'
+    assert my_collection.get_file_type('myJobId/foo.bar.iso.xml') == 'browse'
+    assert my_collection.get_file_type('my.job.id/foo.tar.gz.md5') == 'data'
+    assert my_collection.get_file_type('.xml') == 'metadata'
+
+    for key in ('myJobId/foo.md5', 'myJobId/foo.iso', 'myJobId/xml', 'foo', ''):
+        with pytest.raises(ValueError, match=f'Could not determine file type for {key}'):
+            my_collection.get_file_type(key)
+
+
+def test_opera_rtc_get_file_type():
+    product = 'myJobId/OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0'
+    assert collection.OPERA_RTC.get_file_type(f'{product}.h5') == 'data'
+    assert collection.OPERA_RTC.get_file_type(f'{product}_VV.tif') == 'data'
+    assert collection.OPERA_RTC.get_file_type(f'{product}_BROWSE.png') == 'browse'
+    assert collection.OPERA_RTC.get_file_type(f'{product}.iso.xml') == 'metadata'
+    with pytest.raises(ValueError):
+        collection.OPERA_RTC.get_file_type(f'{product}.xml')
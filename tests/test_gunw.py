@@ -5,6 +5,7 @@ import pytest
 
 import aws
 import gunw
+import util
 from gunw import A19_URL, GUNW_USERNAME, TIBET_URL
 
 
@@ -146,28 +147,32 @@ def test_process_job_if_not_archived(monkeypatch, s3_bucket, gunw_data_path):
         'trace': 'ASF-TOOLS',
     }
 
-    with (
-        patch('util.exists_in_cmr', return_value=False) as mock_exists_in_cmr,
-        patch('aws.send_ingest_message') as mock_publish_message,
-    ):
-        gunw.process_job(job, 'https://foo.com')
+    mock_publish_message = MagicMock()
+    with patch('util.exists_in_cmr', return_value=False) as mock_exists_in_cmr:
+        gunw.process_job(job, 'https://foo.com', mock_publish_message)
 
         mock_exists_in_cmr.assert_called_once_with(
             'cmr.earthdata.nasa.gov', 'ARIA_S1_GUNW', 'myFilename', gunw._granule_ur_pattern
         )
         mock_publish_message.assert_called_once_with('myQueueUrl', expected_ingest_message)
 
-    with (
-        patch('util.exists_in_cmr', return_value=True) as mock_exists_in_cmr,
-        patch('aws.send_ingest_message') as mock_publish_message,
-    ):
-        gunw.process_job(job, 'https://foo.com')
+    mock_publish_message = MagicMock()
+    with patch('util.exists_in_cmr', return_value=True) as mock_exists_in_cmr:
+        gunw.process_job(job, 'https://foo.com', mock_publish_message)
 
         mock_exists_in_cmr.assert_called_once_with(
             'cmr.earthdata.nasa.gov', 'ARIA_S1_GUNW', 'myFilename', gunw._granule_ur_pattern
         )
         mock_publish_message.assert_not_called()
 
+    util.mark_sent('ARIA_S1_GUNW', 'myFilename')
+    mock_publish_message = MagicMock()
+    with patch('util.exists_in_cmr') as mock_exists_in_cmr:
+        gunw.process_job(job, 'https://foo.com', mock_publish_message)
+
+        mock_exists_in_cmr.assert_not_called()
+        mock_publish_message.assert_not_called()
+
 
 @pytest.mark.parametrize(
     'job_type,user_id,hyp3_url,expected_to_qualify',
@@ -251,11 +256,9 @@ def test_process_job_if_qualifies(
         'trace': 'ASF-TOOLS',
     }
 
-    with (
-        patch('util.exists_in_cmr', return_value=False) as mock_exists_in_cmr,
-        patch('aws.send_ingest_message') as mock_publish_message,
-    ):
-        gunw.process_job(job, hyp3_url)
+    mock_publish_message = MagicMock()
+    with patch('util.exists_in_cmr', return_value=False) as mock_exists_in_cmr:
+        gunw.process_job(job, hyp3_url, mock_publish_message)
 
         if expected_to_qualify:
             mock_exists_in_cmr.assert_called_once_with(
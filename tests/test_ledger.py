@@ -0,0 +1,108 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from botocore.stub import ANY, Stubber
+
+import ledger
+
+
+@pytest.fixture()
+def dynamodb_ledger():
+    dynamodb_ledger = ledger.DynamoDbLedger('myTable', ttl_seconds=60)
+    with Stubber(dynamodb_ledger.client) as stubber:
+        yield dynamodb_ledger, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_delivery():
+    assert ledger.get_delivery_id() is None
+    with ledger.delivery('myMessageId'):
+        assert ledger.get_delivery_id() == 'myMessageId'
+        with ledger.delivery(None):
+            assert ledger.get_delivery_id() is None
+        assert ledger.get_delivery_id() == 'myMessageId'
+    assert ledger.get_delivery_id() is None
+
+
+def test_sqlite_ledger(tmp_path):
+    sqlite_ledger = ledger.SqliteLedger(str(tmp_path / 'ledger.sqlite3'), ttl_seconds=60)
+
+    assert sqlite_ledger.get_sent('myMessageId') == set()
+
+    sqlite_ledger.record('myMessageId', 'product1')
+    sqlite_ledger.record('myMessageId', 'product2')
+    sqlite_ledger.record('otherMessageId', 'product3')
+    assert sqlite_ledger.get_sent('myMessageId') == {'product1', 'product2'}
+
+    sqlite_ledger.record('myMessageId', 'product1')
+    assert sqlite_ledger.get_sent('myMessageId') == {'product1', 'product2'}
+
+    reopened = ledger.SqliteLedger(str(tmp_path / 'ledger.sqlite3'), ttl_seconds=60)
+    assert reopened.get_sent('otherMessageId') == {'product3'}
+
+    with patch('time.time', return_value=time.time() + 61):
+        assert sqlite_ledger.get_sent('myMessageId') == set()
+
+
+def test_dynamodb_ledger(dynamodb_ledger):
+    dynamodb_ledger, stubber = dynamodb_ledger
+    query = {
+        'TableName': 'myTable',
+        'KeyConditionExpression': 'delivery_id = :delivery_id',
+        'ExpressionAttributeValues': {':delivery_id': {'S': 'myMessageId'}},
+    }
+
+    stubber.add_response('query', {'Items': []}, query)
+    assert dynamodb_ledger.get_sent('myMessageId') == set()
+
+    stubber.add_response(
+        'put_item',
+        {},
+        {
+            'TableName': 'myTable',
+            'Item': {
+                'delivery_id': {'S': 'myMessageId'},
+                'identifier': {'S': 'product1'},
+                'expires_at': ANY,
+            },
+        },
+    )
+    dynamodb_ledger.record('myMessageId', 'product1')
+
+    def get_item(identifier, expires_at):
+        return {
+            'delivery_id': {'S': 'myMessageId'},
+            'identifier': {'S': identifier},
+            'expires_at': {'N': str(int(expires_at))},
+        }
+
+    stubber.add_response(
+        'query',
+        {
+            'Items': [get_item('product1', time.time() + 60)],
+            'LastEvaluatedKey': {'delivery_id': {'S': 'myMessageId'}, 'identifier': {'S': 'product1'}},
+        },
+        query,
+    )
+    stubber.add_response(
+        'query',
+        {'Items': [get_item('product2', time.time() + 60), get_item('product3', time.time() - 1)]},
+        {**query, 'ExclusiveStartKey': {'delivery_id': {'S': 'myMessageId'}, 'identifier': {'S': 'product1'}}},
+    )
+    assert dynamodb_ledger.get_sent('myMessageId') == {'product1', 'product2'}
+
+
+def test_get_ledger(ledger_path, monkeypatch):
+    sqlite_ledger = ledger.get_ledger()
+    assert isinstance(sqlite_ledger, ledger.SqliteLedger)
+    assert sqlite_ledger.path == str(ledger_path)
+    assert ledger.get_ledger() is sqlite_ledger
+
+    ledger.get_ledger.cache_clear()
+    monkeypatch.setenv('LEDGER_TABLE', 'myTable')
+    monkeypatch.setenv('LEDGER_TTL', '60')
+    dynamodb_ledger = ledger.get_ledger()
+    assert isinstance(dynamodb_ledger, ledger.DynamoDbLedger)
+    assert dynamodb_ledger.table_name == 'myTable'
+    assert dynamodb_ledger.ttl_seconds == 60
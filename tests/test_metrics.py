@@ -0,0 +1,99 @@
+import json
+import threading
+from unittest.mock import patch
+
+import metrics
+
+
+def test_spans(capsys, monkeypatch):
+    monkeypatch.setenv('METRICS_NAMESPACE', 'myNamespace')
+    with (
+        patch('time.perf_counter', side_effect=[1.0, 1.25, 2.0, 2.5, 3.0, 3.125]),
+        patch('time.time', return_value=1700000000.123),
+    ):
+        with metrics.spans(job_type='myJobType'):
+            with metrics.timed('checksum'):
+                pass
+            metrics.set_dimensions(collection='myCollection')
+            with metrics.timed('cmr_check'):
+                pass
+            with metrics.timed('checksum'):
+                pass
+
+    assert json.loads(capsys.readouterr().out) == {
+        '_aws': {
+            'Timestamp': 1700000000123,
+            'CloudWatchMetrics': [
+                {
+                    'Namespace': 'myNamespace',
+                    'Dimensions': [['collection', 'job_type']],
+                    'Metrics': [
+                        {'Name': 'checksum', 'Unit': 'Milliseconds'},
+                        {'Name': 'cmr_check', 'Unit': 'Milliseconds'},
+                    ],
+                },
+            ],
+        },
+        'job_type': 'myJobType',
+        'collection': 'myCollection',
+        'checksum': 375.0,
+        'cmr_check': 500.0,
+    }
+
+
+def test_spans_records_failed_stages(capsys):
+    try:
+        with metrics.spans(), metrics.timed('hyp3_fetch'):
+            raise ValueError
+    except ValueError:
+        pass
+    assert 'hyp3_fetch' in json.loads(capsys.readouterr().out)
+
+
+def test_spans_without_durations(capsys):
+    with metrics.spans(job_type='myJobType'):
+        pass
+    assert capsys.readouterr().out == ''
+
+
+def test_timed_without_spans(capsys):
+    with metrics.timed('checksum'):
+        metrics.set_dimensions(job_type='myJobType')
+    assert capsys.readouterr().out == ''
+
+
+def test_joined_spans(capsys):
+    with metrics.spans(job_type='myJobType'):
+        with metrics.joined_spans(collection='myCollection'), metrics.timed('sqs_send'):
+            pass
+    document = json.loads(capsys.readouterr().out)
+    assert document['job_type'] == 'myJobType'
+    assert 'collection' not in document
+    assert 'sqs_send' in document
+
+    with metrics.joined_spans(collection='myCollection'), metrics.timed('sqs_send'):
+        pass
+    document = json.loads(capsys.readouterr().out)
+    assert document['collection'] == 'myCollection'
+    assert 'sqs_send' in document
+
+
+def test_spans_are_isolated_between_threads():
+    barrier = threading.Barrier(2, timeout=5)
+    results = {}
+
+    def record(job_type):
+        with metrics.spans(job_type=job_type) as current:
+            with metrics.timed(job_type):
+                barrier.wait()
+            results[job_type] = current
+
+    threads = [threading.Thread(target=record, args=(job_type,)) for job_type in ('a', 'b')]
+    with patch('metrics._emit'):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert list(results['a'].durations) == ['a']
+    assert list(results['b'].durations) == ['b']
@@ -1,11 +1,15 @@
 import datetime
-from unittest.mock import MagicMock, call, patch
+from pathlib import Path
+from unittest.mock import ANY, MagicMock, call, patch
 
 import pytest
 from botocore.stub import Stubber
 
 import aws
+import checksum_cache
+import ledger
 import opera_rtc_s1_slc
+import util
 
 
 @pytest.fixture()
@@ -15,13 +19,6 @@ def s3_stubber():
         stubber.assert_no_pending_responses()
 
 
-@pytest.fixture()
-def sqs_stubber():
-    with Stubber(aws.SQS_CLIENT) as stubber:
-        yield stubber
-        stubber.assert_no_pending_responses()
-
-
 def test_granule_ur_pattern():
     payload = 'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0'
     output = 'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_*Z_S1A_30_v1.0'
@@ -37,27 +34,46 @@ def test_granule_ur_pattern():
 
 
 def test_get_products(s3_stubber):
+    contents: list[dict] = [
+        {'ETag': '"77ef801748e2737130d63e1038f9f4e9"', 'Size': 10, 'Key': 'myJobId/product.catalog.json'},
+        {'ETag': '"225ead5b42727928efa38306094669fa"', 'Size': 11, 'Key': 'myJobId/product.log'},
+        {'ETag': '"7b9f787a728ddf63e1b49bb0b4c4b064"', 'Size': 12, 'Key': 'myJobId/product1.h5'},
+        {'ETag': '"dca2e2162b4a50477ca4f8e1235a7f31"', 'Size': 13, 'Key': 'myJobId/product1.iso.xml'},
+        {'ETag': '"5b7bf1e3803e7949ee95138aab36b0fb"', 'Size': 14, 'Key': 'myJobId/product1_BROWSE.png'},
+        {'ETag': '"7a69770eddbf55182a8072d417c762c7"', 'Size': 15, 'Key': 'myJobId/product1_VV.tif'},
+        {'ETag': '"0beab88eaaba3492dc19bd1a52f518df"', 'Size': 16, 'Key': 'myJobId/product1_mask.tif'},
+        {'ETag': '"6f0a5c7f2b0e9d4a8c3e1b7d5f9a2c4e-3"', 'Size': 17, 'Key': 'myJobId/product2.h5'},
+        {'ETag': '"2683f3d3fee5ca2a0c001e39dfa8928e"', 'Size': 18, 'Key': 'myJobId/product2.iso.xml'},
+        {'ETag': '"73460600b568c43869397474914dd458"', 'Size': 19, 'Key': 'myJobId/product2_BROWSE.png'},
+        {'ETag': '"97440fc8fe6288272a7debfe289f9244"', 'Size': 20, 'Key': 'myJobId/product2_VV.tif'},
+        {'ETag': '"50c2b97139120a6c5641be793de5de8b"', 'Size': 21, 'Key': 'myJobId/product2_mask.tif'},
+    ]
     s3_stubber.add_response(
         method='list_objects_v2',
         expected_params={
             'Bucket': 'myBucket',
             'Prefix': 'myJobId',
         },
+        service_response={'Contents': contents},
+    )
+
+    # Checksums resolved by an earlier invocation, so that only the multipart object is looked up with HeadObject.
+    cache = checksum_cache.get_checksum_cache()
+    for obj in contents:
+        if not obj['ETag'].endswith('-3"'):
+            cache.put('myBucket', obj['Key'], obj['ETag'], obj['Size'], (obj['ETag'].strip('"'), 'md5'))
+
+    s3_stubber.add_response(
+        method='head_object',
+        expected_params={
+            'Bucket': 'myBucket',
+            'Key': 'myJobId/product2.h5',
+            'ChecksumMode': 'ENABLED',
+        },
         service_response={
-            'Contents': [
-                {'ETag': '"907a"', 'Size': 10, 'Key': 'myJobId/product.catalog.json'},
-                {'ETag': '"a5a2"', 'Size': 11, 'Key': 'myJobId/product.log'},
-                {'ETag': '"d552"', 'Size': 12, 'Key': 'myJobId/product1.h5'},
-                {'ETag': '"f152"', 'Size': 13, 'Key': 'myJobId/product1.iso.xml'},
-                {'ETag': '"725d"', 'Size': 14, 'Key': 'myJobId/product1_BROWSE.png'},
-                {'ETag': '"64c1"', 'Size': 15, 'Key': 'myJobId/product1_VV.tif'},
-                {'ETag': '"9e70"', 'Size': 16, 'Key': 'myJobId/product1_mask.tif'},
-                {'ETag': '"e772"', 'Size': 17, 'Key': 'myJobId/product2.h5'},
-                {'ETag': '"b6b8"', 'Size': 18, 'Key': 'myJobId/product2.iso.xml'},
-                {'ETag': '"662f"', 'Size': 19, 'Key': 'myJobId/product2_BROWSE.png'},
-                {'ETag': '"68ad"', 'Size': 20, 'Key': 'myJobId/product2_VV.tif'},
-                {'ETag': '"fc90"', 'Size': 21, 'Key': 'myJobId/product2_mask.tif'},
-            ]
+            'ETag': '"6f0a5c7f2b0e9d4a8c3e1b7d5f9a2c4e-3"',
+            'ChecksumSHA256': 'DCy288jU8LHp+dKnxbPh8KnYx7al9OPSwbCp+OfWxbQ=',
+            'ChecksumType': 'FULL_OBJECT',
         },
     )
 
@@ -71,7 +87,7 @@ def test_get_products(s3_stubber):
                     'type': 'data',
                     'uri': 's3://myBucket/myJobId/product1.h5',
                     'size': 12,
-                    'checksum': 'd552',
+                    'checksum': '7b9f787a728ddf63e1b49bb0b4c4b064',
                     'checksumType': 'md5',
                 },
                 {
@@ -79,7 +95,7 @@ def test_get_products(s3_stubber):
                     'type': 'metadata',
                     'uri': 's3://myBucket/myJobId/product1.iso.xml',
                     'size': 13,
-                    'checksum': 'f152',
+                    'checksum': 'dca2e2162b4a50477ca4f8e1235a7f31',
                     'checksumType': 'md5',
                 },
                 {
@@ -87,7 +103,7 @@ def test_get_products(s3_stubber):
                     'type': 'browse',
                     'uri': 's3://myBucket/myJobId/product1_BROWSE.png',
                     'size': 14,
-                    'checksum': '725d',
+                    'checksum': '5b7bf1e3803e7949ee95138aab36b0fb',
                     'checksumType': 'md5',
                 },
                 {
@@ -95,7 +111,7 @@ def test_get_products(s3_stubber):
                     'type': 'data',
                     'uri': 's3://myBucket/myJobId/product1_VV.tif',
                     'size': 15,
-                    'checksum': '64c1',
+                    'checksum': '7a69770eddbf55182a8072d417c762c7',
                     'checksumType': 'md5',
                 },
                 {
@@ -103,7 +119,7 @@ def test_get_products(s3_stubber):
                     'type': 'data',
                     'uri': 's3://myBucket/myJobId/product1_mask.tif',
                     'size': 16,
-                    'checksum': '9e70',
+                    'checksum': '0beab88eaaba3492dc19bd1a52f518df',
                     'checksumType': 'md5',
                 },
             ],
@@ -117,15 +133,15 @@ def test_get_products(s3_stubber):
                     'type': 'data',
                     'uri': 's3://myBucket/myJobId/product2.h5',
                     'size': 17,
-                    'checksum': 'e772',
-                    'checksumType': 'md5',
+                    'checksum': '0c2cb6f3c8d4f0b1e9f9d2a7c5b3e1f0a9d8c7b6a5f4e3d2c1b0a9f8e7d6c5b4',
+                    'checksumType': 'sha256',
                 },
                 {
                     'name': 'product2.iso.xml',
                     'type': 'metadata',
                     'uri': 's3://myBucket/myJobId/product2.iso.xml',
                     'size': 18,
-                    'checksum': 'b6b8',
+                    'checksum': '2683f3d3fee5ca2a0c001e39dfa8928e',
                     'checksumType': 'md5',
                 },
                 {
@@ -133,7 +149,7 @@ def test_get_products(s3_stubber):
                     'type': 'browse',
                     'uri': 's3://myBucket/myJobId/product2_BROWSE.png',
                     'size': 19,
-                    'checksum': '662f',
+                    'checksum': '73460600b568c43869397474914dd458',
                     'checksumType': 'md5',
                 },
                 {
@@ -141,7 +157,7 @@ def test_get_products(s3_stubber):
                     'type': 'data',
                     'uri': 's3://myBucket/myJobId/product2_VV.tif',
                     'size': 20,
-                    'checksum': '68ad',
+                    'checksum': '97440fc8fe6288272a7debfe289f9244',
                     'checksumType': 'md5',
                 },
                 {
@@ -149,7 +165,7 @@ def test_get_products(s3_stubber):
                     'type': 'data',
                     'uri': 's3://myBucket/myJobId/product2_mask.tif',
                     'size': 21,
-                    'checksum': 'fc90',
+                    'checksum': '50c2b97139120a6c5641be793de5de8b',
                     'checksumType': 'md5',
                 },
             ],
@@ -176,23 +192,8 @@ def test_get_message(monkeypatch):
     mock_datetime.now.assert_called_once_with(tz=datetime.UTC)
 
 
-def test_send_messages(sqs_stubber):
-    sqs_stubber.add_response(
-        method='send_message',
-        expected_params={
-            'QueueUrl': 'myQueue',
-            'MessageBody': '{"identifier": "foo"}',
-        },
-        service_response={},
-    )
-    sqs_stubber.add_response(
-        method='send_message',
-        expected_params={
-            'QueueUrl': 'myQueue',
-            'MessageBody': '{"identifier": "bar"}',
-        },
-        service_response={},
-    )
+def test_send_messages():
+    mock_publish = MagicMock()
 
     opera_rtc_s1_slc._send_messages(
         queue_url='myQueue',
@@ -200,17 +201,87 @@ def test_send_messages(sqs_stubber):
             {'identifier': 'foo'},  # type: ignore[typeddict-item]
             {'identifier': 'bar'},  # type: ignore[typeddict-item]
         ],
+        publish=mock_publish,
+    )
+
+    assert mock_publish.mock_calls == [
+        call('myQueue', {'identifier': 'foo'}, on_sent=None),
+        call('myQueue', {'identifier': 'bar'}, on_sent=None),
+    ]
+
+    mock_publish.reset_mock()
+    with ledger.delivery('myMessageId'):
+        opera_rtc_s1_slc._send_messages(
+            queue_url='myQueue',
+            messages=[{'identifier': 'foo'}, {'identifier': 'bar'}],  # type: ignore[typeddict-item]
+            publish=mock_publish,
+        )
+
+    assert mock_publish.mock_calls == [
+        call('myQueue', {'identifier': 'foo'}, on_sent=ANY),
+        call('myQueue', {'identifier': 'bar'}, on_sent=ANY),
+    ]
+    assert ledger.get_ledger().get_sent('myMessageId') == set()
+
+    mock_publish.mock_calls[1].kwargs['on_sent']()
+    assert ledger.get_ledger().get_sent('myMessageId') == {'bar'}
+
+
+def test_group_by_product():
+    objects = [
+        aws.S3Object(key=f'myJobId/{name}', size=1, etag='"foo"')
+        for name in (
+            'product.catalog.json',
+            'product1.h5',
+            'product1.iso.xml',
+            'product10.h5',
+            'product10.iso.xml',
+            'product10_BROWSE.png',
+            'product1_BROWSE.png',
+            'product1_VV.tif',
+            'product10_VV.tif',
+            'product2_VV.tif',
+        )
+    ]
+    assert {
+        product_name: [Path(obj.key).name for obj in product_objects]
+        for product_name, product_objects in opera_rtc_s1_slc._group_by_product(objects).items()
+    } == {
+        'product1': ['product1.h5', 'product1.iso.xml', 'product1_BROWSE.png', 'product1_VV.tif'],
+        'product10': ['product10.h5', 'product10.iso.xml', 'product10_BROWSE.png', 'product10_VV.tif'],
+    }
+
+
+def test_get_product_name():
+    product_names = {
+        'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0',
+        'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0_extra',
+    }
+    assert (
+        opera_rtc_s1_slc._get_product_name(
+            'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0_VV.tif', product_names
+        )
+        == 'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0'
+    )
+    assert (
+        opera_rtc_s1_slc._get_product_name(
+            'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0_extra.iso.xml', product_names
+        )
+        == 'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0_extra'
     )
+    assert opera_rtc_s1_slc._get_product_name('OPERA_L2_RTC-S1_T075-160101-IW2.png', product_names) is None
+    assert opera_rtc_s1_slc._get_product_name('product.log', product_names) is None
+    assert opera_rtc_s1_slc._get_product_name('', product_names) is None
 
 
 def test_process_job(monkeypatch):
-    def mock_exists_in_cmr(cmr_domain, short_name, granule_ur, granule_ur_pattern):
+    def mock_find_in_cmr(cmr_domain, short_name, granule_urs, granule_ur_pattern):
         assert cmr_domain == 'test-cmr-domain'
         assert short_name == 'OPERA_L2_RTC-S1_V1'
         assert granule_ur_pattern is opera_rtc_s1_slc._granule_ur_pattern
 
-        assert granule_ur in ('product1', 'product2', 'product3')
-        return granule_ur == 'product2'
+        assert granule_urs == ['product1', 'product2', 'product3']
+        return {'product1': None, 'product2': 'product2-in-cmr', 'product3': None}
 
     monkeypatch.setenv('CMR_DOMAIN', 'test-cmr-domain')
     monkeypatch.setenv('HYP3_CONTENT_BUCKET', 'test-bucket')
@@ -222,6 +293,7 @@ def test_process_job(monkeypatch):
     monkeypatch.setattr(datetime, 'datetime', mock_datetime)
 
     job = {'job_id': 'test-job'}
+    mock_publish = MagicMock()
     expected_messages = [
         {
             'identifier': 'product1',
@@ -247,17 +319,85 @@ def test_process_job(monkeypatch):
             'opera_rtc_s1_slc._get_products',
             return_value=[{'name': 'product1'}, {'name': 'product2'}, {'name': 'product3'}],
         ) as mock_get_products,
-        patch('util.exists_in_cmr', mock_exists_in_cmr),
+        patch('util.find_in_cmr', mock_find_in_cmr),
         patch('opera_rtc_s1_slc._send_messages') as mock_send_messages,
     ):
-        opera_rtc_s1_slc.process_job(job)
+        opera_rtc_s1_slc.process_job(job, mock_publish)
 
         assert mock_datetime.now.mock_calls == [
             call(tz=datetime.UTC),
             call(tz=datetime.UTC),
         ]
-        mock_get_products.assert_called_once_with('test-bucket', 'test-job')
-        mock_send_messages.assert_called_once_with('test-queue-url', expected_messages)
+        mock_get_products.assert_called_once_with('test-bucket', 'test-job', set())
+        mock_send_messages.assert_called_once_with('test-queue-url', expected_messages, mock_publish)
+
+
+def test_process_job_skips_recently_sent(monkeypatch):
+    monkeypatch.setenv('CMR_DOMAIN', 'test-cmr-domain')
+    monkeypatch.setenv('HYP3_CONTENT_BUCKET', 'test-bucket')
+    monkeypatch.setenv('OPERA_RTC_QUEUE_URL', 'test-queue-url')
+    util.mark_sent('OPERA_L2_RTC-S1_V1', 'product2')
+
+    objects = [
+        aws.S3Object(key=f'test-job/{name}{suffix}', size=1, etag='"foo"')
+        for name in ('product1', 'product2')
+        for suffix in ('.h5', '_VV.tif')
+    ]
+    with (
+        patch('aws.list_objects_for_job', return_value=objects),
+        patch('aws.get_checksums', return_value=[aws.Checksum(value='myChecksum', type='md5')] * 2) as mock_checksums,
+        patch('util.find_in_cmr', return_value={'product1': None}) as mock_find_in_cmr,
+        patch('opera_rtc_s1_slc._send_messages') as mock_send_messages,
+    ):
+        opera_rtc_s1_slc.process_job({'job_id': 'test-job'}, MagicMock())
+
+        mock_checksums.assert_called_once_with('test-bucket', objects[:2])
+        assert mock_find_in_cmr.mock_calls == [
+            call('test-cmr-domain', 'OPERA_L2_RTC-S1_V1', ['product1'], opera_rtc_s1_slc._granule_ur_pattern)
+        ]
+        assert [message['identifier'] for message in mock_send_messages.call_args.args[1]] == ['product1']
+
+
+def test_process_job_skips_products_in_ledger(monkeypatch):
+    monkeypatch.setenv('CMR_DOMAIN', 'test-cmr-domain')
+    monkeypatch.setenv('HYP3_CONTENT_BUCKET', 'test-bucket')
+    monkeypatch.setenv('OPERA_RTC_QUEUE_URL', 'test-queue-url')
+    ledger.get_ledger().record('myMessageId', 'product1')
+    ledger.get_ledger().record('otherMessageId', 'product2')
+
+    objects = [
+        aws.S3Object(key=f'test-job/{name}{suffix}', size=1, etag='"foo"')
+        for name in ('product1', 'product2')
+        for suffix in ('.h5', '_VV.tif')
+    ]
+    checksums = [aws.Checksum(value='myChecksum', type='md5')] * 2
+    with (
+        patch('aws.list_objects_for_job', return_value=objects),
+        patch('aws.get_checksums', return_value=checksums) as mock_get_checksums,
+        patch('util.find_in_cmr', return_value={'product2': None}) as mock_find_in_cmr,
+        patch('opera_rtc_s1_slc._send_messages') as mock_send_messages,
+    ):
+        with ledger.delivery('myMessageId'):
+            opera_rtc_s1_slc.process_job({'job_id': 'test-job'}, MagicMock())
+
+        mock_get_checksums.assert_called_once_with('test-bucket', objects[2:])
+        assert mock_find_in_cmr.call_args.args[2] == ['product2']
+        assert [message['identifier'] for message in mock_send_messages.call_args.args[1]] == ['product2']
+
+    # A job that is re-published, or backfilled, is sent in full.
+    with (
+        patch('aws.list_objects_for_job', return_value=objects),
+        patch('aws.get_checksums', return_value=checksums) as mock_get_checksums,
+        patch('util.find_in_cmr', return_value={'product1': None, 'product2': None}),
+        patch('opera_rtc_s1_slc._send_messages') as mock_send_messages,
+    ):
+        for delivery_id in ('newMessageId', None):
+            with ledger.delivery(delivery_id):
+                opera_rtc_s1_slc.process_job({'job_id': 'test-job'}, MagicMock())
+            assert [message['identifier'] for message in mock_send_messages.call_args.args[1]] == [
+                'product1',
+                'product2',
+            ]
 
 
 def test_opera_get_file_type():
@@ -1,16 +1,29 @@
+import io
+import json
 import sys
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 
 import pytest
+from botocore.exceptions import ClientError
 
+import job_snapshot
 import plugin
 
 
+@pytest.fixture(autouse=True)
+def sns_clients():
+    plugin.get_sns_client.cache_clear()
+    yield
+    plugin.get_sns_client.cache_clear()
+
+
 def test_get_args(monkeypatch):
+    monkeypatch.setenv('JOB_SNAPSHOT_KEY', 'myKey')
     args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '123'])
     assert args.hyp3_url == 'foo'
     assert args.topic_arn == 'bar'
-    assert args.job_id == '123'
+    assert args.job_ids == ['123']
 
     with pytest.raises(SystemExit), monkeypatch.context() as m:
         m.setattr(sys, 'argv', ['foo.py'])
@@ -28,7 +41,7 @@ def test_get_args(monkeypatch):
         args = plugin.get_args(['321'])
         assert args.hyp3_url == 'url'
         assert args.topic_arn == 'arn'
-        assert args.job_id == '321'
+        assert args.job_ids == ['321']
 
     with monkeypatch.context() as m:
         m.setenv('HYP3_URL', 'abc')
@@ -37,7 +50,50 @@ def test_get_args(monkeypatch):
         args = plugin.get_args()
         assert args.hyp3_url == 'abc'
         assert args.topic_arn == 'def'
-        assert args.job_id == '234'
+        assert args.job_ids == ['234']
+        assert args.job_snapshot is None
+
+    args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-snapshot', 'job.json', '123'])
+    assert args.job_snapshot == Path('job.json')
+
+    with monkeypatch.context() as m:
+        m.setenv('JOB_SNAPSHOT', '/tmp/job.json')
+        args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '123'])
+        assert args.job_snapshot == Path('/tmp/job.json')
+
+    with pytest.raises(ValueError, match='A job snapshot can only be sent with a single job ID'):
+        plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-snapshot', 'job.json', '123', '456'])
+
+    with monkeypatch.context() as m:
+        m.delenv('JOB_SNAPSHOT_KEY', raising=False)
+        with pytest.raises(ValueError, match='A job snapshot key must be provided'):
+            plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-snapshot', 'job.json', '123'])
+
+        args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-snapshot-key', 'myKey', '123'])
+        assert args.job_snapshot_key == 'myKey'
+
+        m.setenv('JOB_SNAPSHOT_KEY', 'envKey')
+        args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-snapshot', 'job.json', '123'])
+        assert args.job_snapshot_key == 'envKey'
+
+
+def test_get_args_multiple_job_ids(monkeypatch, tmp_path):
+    args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '123', '456'])
+    assert args.job_ids == ['123', '456']
+
+    (tmp_path / 'job_ids.txt').write_text('789\n\nabc\n')
+    args = plugin.get_args(
+        ['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-ids-file', str(tmp_path / 'job_ids.txt'), '123']
+    )
+    assert args.job_ids == ['123', '789', 'abc']
+
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('def\nghi\n'))
+    args = plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-ids-file', '-'])
+    assert args.job_ids == ['def', 'ghi']
+
+    (tmp_path / 'empty.txt').write_text('')
+    with pytest.raises(SystemExit):
+        plugin.get_args(['--hyp3-url', 'foo', '--topic-arn', 'bar', '--job-ids-file', str(tmp_path / 'empty.txt')])
 
 
 def test_publish():
@@ -64,3 +120,132 @@ def test_publish():
             TopicArn='arn:aws:sns:us-west-2:123456789012:myTopic',
             Message='{"hyp3_url": "https://bar.com", "job_id": "def456"}',
         )
+
+
+def test_publish_reuses_client():
+    with patch('boto3.client') as mock_client:
+        plugin.publish('https://foo.com', 'abc123', 'arn:aws:sns:us-east-1:123456789012:myTopic')
+        plugin.publish('https://foo.com', 'def456', 'arn:aws:sns:us-east-1:123456789012:myTopic')
+        mock_client.assert_called_once_with('sns', region_name='us-east-1')
+        assert mock_client.return_value.publish.call_count == 2
+
+
+def test_publish_batch():
+    job_ids = [f'job{i}' for i in range(23)]
+    topic_arn = 'arn:aws:sns:us-west-2:123456789012:myTopic'
+
+    def mock_publish_batch(TopicArn, PublishBatchRequestEntries):
+        assert TopicArn == topic_arn
+        messages = [json.loads(entry['Message']) for entry in PublishBatchRequestEntries]
+        assert all(message['hyp3_url'] == 'https://foo.com' for message in messages)
+        assert [entry['Id'] for entry in PublishBatchRequestEntries] == [
+            str(i) for i in range(len(PublishBatchRequestEntries))
+        ]
+        if messages[0]['job_id'] == 'job10':
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'PublishBatch')
+        if messages[0]['job_id'] == 'job0':
+            return {
+                'Successful': [{'Id': str(i)} for i in range(10) if i != 3],
+                'Failed': [{'Id': '3', 'Code': 'InternalError', 'SenderFault': False}],
+            }
+        return {'Successful': [{'Id': str(i)} for i in range(len(messages))], 'Failed': []}
+
+    with patch('boto3.client') as mock_client:
+        mock_client.return_value.publish_batch.side_effect = mock_publish_batch
+        failed_job_ids = plugin.publish_batch('https://foo.com', job_ids, topic_arn)
+
+    mock_client.assert_called_once_with('sns', region_name='us-west-2')
+    batches = [
+        [json.loads(entry['Message'])['job_id'] for entry in c.kwargs['PublishBatchRequestEntries']]
+        for c in mock_client.return_value.publish_batch.mock_calls
+    ]
+    assert batches == [job_ids[:10], job_ids[10:20], job_ids[20:]]
+    assert failed_job_ids == ['job3', *job_ids[10:20]]
+
+
+def test_create_job_snapshot():
+    job = {
+        'job_id': 'abc123',
+        'job_type': 'OPERA_RTC_S1_SLC',
+        'user_id': 'myUser',
+        'files': [{'s3': {'bucket': 'myBucket', 'key': 'abc123/product.h5'}}],
+        'status_code': 'SUCCEEDED',
+    }
+    snapshot = job_snapshot.create(job, 'myKey')
+    assert snapshot == {
+        'version': 2,
+        'job': {
+            'job_id': 'abc123',
+            'job_type': 'OPERA_RTC_S1_SLC',
+            'user_id': 'myUser',
+            'files': [{'s3': {'bucket': 'myBucket', 'key': 'abc123/product.h5'}}],
+        },
+        'signature': job_snapshot.get_signature(snapshot['job'], 'myKey'),
+    }
+    assert job_snapshot.is_signed(snapshot, 'myKey')
+    assert not job_snapshot.is_signed(snapshot, 'otherKey')
+    assert not job_snapshot.is_signed({**snapshot, 'signature': None}, 'myKey')
+
+    assert job_snapshot.get_signature({'b': 1, 'a': [1, 2]}, 'myKey') == job_snapshot.get_signature(
+        {'a': [1, 2], 'b': 1}, 'myKey'
+    )
+    assert job_snapshot.get_signature({'a': 1}, 'myKey') != job_snapshot.get_signature({'a': 2}, 'myKey')
+    assert job_snapshot.get_signature({'a': 1}, 'myKey') != job_snapshot.get_signature({'a': 1}, 'otherKey')
+
+
+def test_publish_with_job_snapshot():
+    job = {'job_id': 'abc123', 'job_type': 'ARIA_S1_GUNW', 'user_id': 'myUser', 'files': [{'filename': 'foo.nc'}]}
+    snapshot = job_snapshot.create(job, 'myKey')
+
+    with patch('boto3.client') as mock_client:
+        mock_sns = MagicMock()
+        mock_client.return_value = mock_sns
+
+        plugin.publish('https://foo.com', 'abc123', 'arn:aws:sns:us-east-1:123456789012:myTopic', snapshot)
+
+        message = json.loads(mock_sns.publish.call_args.kwargs['Message'])
+        assert message == {
+            'hyp3_url': 'https://foo.com',
+            'job_id': 'abc123',
+            'job_snapshot': snapshot,
+        }
+
+
+def test_main(monkeypatch, tmp_path):
+    job = {'job_id': 'abc123', 'job_type': 'ARIA_S1_GUNW', 'user_id': 'myUser', 'files': [{'filename': 'foo.nc'}]}
+    (tmp_path / 'job.json').write_text(json.dumps(job))
+
+    monkeypatch.setenv('HYP3_URL', 'https://foo.com')
+    monkeypatch.setenv('TOPIC_ARN', 'arn:aws:sns:us-east-1:123456789012:myTopic')
+    monkeypatch.setenv('JOB_SNAPSHOT_KEY', 'myKey')
+
+    with patch('plugin.publish') as mock_publish:
+        monkeypatch.setattr(sys, 'argv', ['plugin.py', 'abc123'])
+        plugin.main()
+        mock_publish.assert_called_once_with(
+            'https://foo.com', 'abc123', 'arn:aws:sns:us-east-1:123456789012:myTopic', None
+        )
+
+    with patch('plugin.publish') as mock_publish:
+        monkeypatch.setattr(sys, 'argv', ['plugin.py', 'abc123', '--job-snapshot', str(tmp_path / 'job.json')])
+        plugin.main()
+        mock_publish.assert_called_once_with(
+            'https://foo.com', 'abc123', 'arn:aws:sns:us-east-1:123456789012:myTopic', job_snapshot.create(job, 'myKey')
+        )
+
+
+def test_main_batch(monkeypatch):
+    monkeypatch.setenv('HYP3_URL', 'https://foo.com')
+    monkeypatch.setenv('TOPIC_ARN', 'arn:aws:sns:us-east-1:123456789012:myTopic')
+    monkeypatch.delenv('JOB_SNAPSHOT', raising=False)
+    monkeypatch.setattr(sys, 'argv', ['plugin.py', 'abc123', 'def456'])
+
+    with patch('plugin.publish_batch', return_value=[]) as mock_publish_batch:
+        plugin.main()
+        mock_publish_batch.assert_called_once_with(
+            'https://foo.com', ['abc123', 'def456'], 'arn:aws:sns:us-east-1:123456789012:myTopic'
+        )
+
+    with patch('plugin.publish_batch', return_value=['def456']):
+        with pytest.raises(SystemExit, match='Could not publish 1 of 2 jobs'):
+            plugin.main()
@@ -0,0 +1,125 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with patch('time.monotonic', clock.monotonic), patch('time.sleep', clock.sleep):
+        yield clock
+
+
+def test_acquire(clock):
+    rate_limiter = ratelimit.AdaptiveRateLimiter(rate=2.0, max_rate=10.0)
+
+    rate_limiter.acquire()
+    assert clock.sleeps == []
+
+    rate_limiter.acquire()
+    rate_limiter.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+    clock.now += 10.0
+    rate_limiter.acquire()
+    rate_limiter.acquire()
+    rate_limiter.acquire()
+    assert clock.sleeps == [0.5, 0.5, 0.5]
+
+
+def test_on_success(clock):
+    rate_limiter = ratelimit.AdaptiveRateLimiter(rate=1.0, max_rate=1.25)
+
+    rate_limiter.on_success()
+    assert rate_limiter.rate == pytest.approx(1.1)
+
+    rate_limiter.on_success()
+    rate_limiter.on_success()
+    assert rate_limiter.rate == 1.25
+
+
+def test_on_throttle(clock):
+    rate_limiter = ratelimit.AdaptiveRateLimiter(rate=8.0, max_rate=10.0)
+
+    rate_limiter.on_throttle()
+    assert rate_limiter.rate == 4.0
+
+    rate_limiter.on_throttle()
+    assert rate_limiter.rate == 4.0
+
+    clock.now += ratelimit.DECREASE_INTERVAL_SECONDS
+    rate_limiter.on_throttle()
+    assert rate_limiter.rate == 2.0
+
+    for _ in range(5):
+        clock.now += ratelimit.DECREASE_INTERVAL_SECONDS
+        rate_limiter.on_throttle()
+    assert rate_limiter.rate == ratelimit.MIN_RATE
+
+
+def test_on_throttle_retry_after(clock):
+    rate_limiter = ratelimit.AdaptiveRateLimiter(rate=10.0, max_rate=10.0)
+
+    rate_limiter.on_throttle(retry_after=3.0)
+    rate_limiter.acquire()
+    assert clock.now == pytest.approx(3.2)
+
+    rate_limiter.acquire()
+    assert clock.now == pytest.approx(3.4)
+
+
+def test_get_rate_limiter():
+    cmr = ratelimit.get_rate_limiter('cmr.earthdata.nasa.gov', 10.0, 50.0)
+    assert ratelimit.get_rate_limiter('cmr.earthdata.nasa.gov', 1.0, 1.0) is cmr
+    assert cmr.rate == 10.0
+
+    hyp3 = ratelimit.get_rate_limiter('https://hyp3-api.asf.alaska.edu', 5.0, 20.0)
+    assert hyp3 is not cmr
+    assert hyp3.rate == 5.0
+
+
+def test_acquire_is_shared_across_threads():
+    rate_limiter = ratelimit.AdaptiveRateLimiter(rate=200.0, max_rate=200.0)
+
+    def worker():
+        for _ in range(10):
+            rate_limiter.acquire()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The first request is allowed immediately and the other 39 are paced at 200 per second between all threads.
+    assert time.monotonic() - start >= 39 / 200 * 0.95
+
+
+def test_parse_retry_after():
+    assert ratelimit.parse_retry_after(None) is None
+    assert ratelimit.parse_retry_after('3') == 3.0
+    assert ratelimit.parse_retry_after('0.5') == 0.5
+    assert ratelimit.parse_retry_after('-1') == 0.0
+    assert ratelimit.parse_retry_after('foo') is None
+
+    with patch('time.time', return_value=1445412480.0):
+        assert ratelimit.parse_retry_after('Wed, 21 Oct 2015 07:28:30 GMT') == 30.0
+        assert ratelimit.parse_retry_after('Wed, 21 Oct 2015 07:27:00 GMT') == 0.0
@@ -0,0 +1,21 @@
+import sqlite3
+import time
+from contextlib import closing
+from unittest.mock import patch
+
+import ttl_store
+
+
+def test_sqlite_ttl_store_expiration(tmp_path):
+    path = str(tmp_path / 'store.sqlite3')
+    store = ttl_store.SqliteTtlStore(path, 60, 'items', 'name TEXT', 'name')
+    store._insert('foo')
+    assert store._select('name', 'name = ?', ('foo',)) == [('foo',)]
+
+    with patch('time.time', return_value=time.time() + 61):
+        assert store._select('name', 'name = ?', ('foo',)) == []
+
+        # Expired rows are deleted when the store is opened by a later invocation.
+        ttl_store.SqliteTtlStore(path, 60, 'items', 'name TEXT', 'name')
+    with closing(sqlite3.connect(path)) as connection:
+        assert connection.execute('SELECT COUNT(*) FROM items').fetchone() == (0,)
@@ -1,53 +1,306 @@
+from unittest.mock import patch
+
+import pytest
+import requests
 import responses
 
 import gunw
+import opera_rtc_s1_slc
 import util
 
 
+@pytest.fixture
+def cmr_session(monkeypatch):
+    monkeypatch.setenv('CMR_BACKOFF_FACTOR', '0')
+    monkeypatch.setenv('CMR_BACKOFF_JITTER', '0')
+    util.get_cmr_session.cache_clear()
+    yield util.get_cmr_session()
+    util.get_cmr_session.cache_clear()
+
+
+def test_get_cmr_session(monkeypatch):
+    util.get_cmr_session.cache_clear()
+    monkeypatch.setenv('CMR_POOL_SIZE', '4')
+    monkeypatch.setenv('CMR_MAX_RETRIES', '5')
+
+    session = util.get_cmr_session()
+    assert util.get_cmr_session() is session
+
+    adapter = session.get_adapter('https://cmr.earthdata.nasa.gov')
+    assert adapter._pool_maxsize == 4  # type: ignore[attr-defined]
+    assert adapter.max_retries.total == 5  # type: ignore[attr-defined]
+    assert adapter.max_retries.status_forcelist == (429, 500, 502, 503, 504)  # type: ignore[attr-defined]
+    util.get_cmr_session.cache_clear()
+
+
+def test_get_cmr_timeout(monkeypatch):
+    assert util.get_cmr_timeout() == (3.05, 30.0)
+
+    monkeypatch.setenv('CMR_CONNECT_TIMEOUT', '1')
+    monkeypatch.setenv('CMR_READ_TIMEOUT', '2.5')
+    assert util.get_cmr_timeout() == (1.0, 2.5)
+
+
+@responses.activate(registry=responses.registries.OrderedRegistry)
+def test_find_in_cmr_retries(cmr_session):
+    url = 'https://cmr.earthdata.nasa.gov/search/granules.json'
+    responses.get(url, status=503)
+    responses.get(url, status=429, headers={'Retry-After': '0'})
+    responses.get(url, status=200, json={'feed': {'entry': [{'title': 'foo-2'}]}})
+
+    assert util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['foo-1'], gunw._granule_ur_pattern) == {
+        'foo-1': 'foo-2'
+    }
+    assert len(responses.calls) == 3
+
+    responses.get(url, status=500)
+    responses.get(url, status=500)
+    responses.get(url, status=500)
+    responses.get(url, status=500)
+    with pytest.raises(requests.HTTPError):
+        util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['bar-1'], gunw._granule_ur_pattern)
+
+
+@responses.activate(registry=responses.registries.OrderedRegistry)
+def test_find_in_cmr_adapts_to_throttling(cmr_session, monkeypatch):
+    monkeypatch.setenv('CMR_RATE_LIMIT', '8')
+    url = 'https://cmr.earthdata.nasa.gov/search/granules.json'
+    responses.get(url, status=429, headers={'Retry-After': '0'})
+    responses.get(url, status=200, json={'feed': {'entry': []}})
+    responses.get(url, status=200, json={'feed': {'entry': []}})
+
+    assert util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['foo-1'], gunw._granule_ur_pattern) == {
+        'foo-1': None
+    }
+    rate_limiter = util.get_cmr_rate_limiter('cmr.earthdata.nasa.gov')
+    assert rate_limiter.rate == pytest.approx(4.1)
+
+    util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['bar-1'], gunw._granule_ur_pattern)
+    assert rate_limiter.rate == pytest.approx(4.2)
+
+
+@responses.activate
+def test_find_in_cmr_caches_existing_granules():
+    url = 'https://cmr.earthdata.nasa.gov/search/granules.json'
+    responses.get(url, json={'feed': {'entry': [{'title': 'foo-2'}]}})
+
+    assert util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['foo-1', 'bar-1'], gunw._granule_ur_pattern) == {
+        'foo-1': 'foo-2',
+        'bar-1': None,
+    }
+    assert len(responses.calls) == 1
+
+    responses.get(
+        url,
+        json={'feed': {'entry': []}},
+        match=[
+            responses.matchers.query_param_matcher(
+                {
+                    'short_name': 'myCollection',
+                    'granule_ur[]': 'bar-*',
+                    'options[granule_ur][pattern]': 'true',
+                    'page_size': '2000',
+                }
+            )
+        ],
+    )
+    assert util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['foo-1', 'bar-1'], gunw._granule_ur_pattern) == {
+        'foo-1': 'foo-2',
+        'bar-1': None,
+    }
+    assert len(responses.calls) == 2
+
+    assert util.find_in_cmr('cmr.earthdata.nasa.gov', 'myCollection', ['foo-1'], gunw._granule_ur_pattern) == {
+        'foo-1': 'foo-2'
+    }
+    assert len(responses.calls) == 2
+
+
+def test_ttl_cache():
+    cache: util.TtlCache[str, int] = util.TtlCache(max_size=2, ttl_seconds=10)
+    with patch('time.monotonic', return_value=100):
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    with patch('time.monotonic', return_value=110):
+        assert cache.get('a') is None
+        assert cache.get('c') is None
+
+
+def test_recently_sent(monkeypatch):
+    monkeypatch.setenv('RECENTLY_SENT_TTL', '60')
+    util.get_recently_sent.cache_clear()
+    with patch('time.monotonic', return_value=100):
+        assert not util.was_recently_sent('myCollection', 'foo')
+        util.mark_sent('myCollection', 'foo')
+        assert util.was_recently_sent('myCollection', 'foo')
+        assert not util.was_recently_sent('otherCollection', 'foo')
+
+    with patch('time.monotonic', return_value=160):
+        assert not util.was_recently_sent('myCollection', 'foo')
+
+
 @responses.activate
 def test_exists_in_cmr():
     responses.get(
-        'https://cmr.earthdata.nasa.gov/search/granules.umm_json',
+        'https://cmr.earthdata.nasa.gov/search/granules.json',
         status=200,
         match=[
             responses.matchers.query_param_matcher(
                 {
                     'short_name': 'ARIA_S1_GUNW',
-                    'granule_ur': 'S1-GUNW-D-R-036-tops-20250131_20241226-041630-00025E_00035N-PP-99eb-*',
+                    'granule_ur[]': 'S1-GUNW-D-R-036-tops-20250131_20241226-041630-00025E_00035N-PP-99eb-*',
                     'options[granule_ur][pattern]': 'true',
-                    'page_size': 1,
+                    'page_size': '2000',
                 },
             ),
         ],
         json={
-            'items': [
-                {
-                    'umm': {
-                        'GranuleUR': 'myGranule',
-                    },
-                },
-            ],
+            'feed': {
+                'entry': [
+                    {'title': 'S1-GUNW-D-R-036-tops-20250131_20241226-041630-00025E_00035N-PP-99eb-v3_0_0'},
+                ],
+            },
         },
     )
     granule_ur = 'S1-GUNW-D-R-036-tops-20250131_20241226-041630-00025E_00035N-PP-99eb-v3_0_1'
     assert util.exists_in_cmr('cmr.earthdata.nasa.gov', 'ARIA_S1_GUNW', granule_ur, gunw._granule_ur_pattern)
 
     responses.get(
-        'https://cmr.uat.earthdata.nasa.gov/search/granules.umm_json',
+        'https://cmr.uat.earthdata.nasa.gov/search/granules.json',
         status=200,
         match=[
             responses.matchers.query_param_matcher(
                 {
                     'short_name': 'ARIA_S1_GUNW',
-                    'granule_ur': 'S1-GUNW-D-R-123-tops-20230605_20230512-032645-00038E_00036N-PP-f518-*',
+                    'granule_ur[]': 'S1-GUNW-D-R-123-tops-20230605_20230512-032645-00038E_00036N-PP-f518-*',
                     'options[granule_ur][pattern]': 'true',
-                    'page_size': 1,
+                    'page_size': '2000',
                 },
             ),
         ],
         json={
-            'items': [],
+            'feed': {
+                'entry': [],
+            },
         },
     )
     granule_ur = 'S1-GUNW-D-R-123-tops-20230605_20230512-032645-00038E_00036N-PP-f518-v3_0_0'
     assert not util.exists_in_cmr('cmr.uat.earthdata.nasa.gov', 'ARIA_S1_GUNW', granule_ur, gunw._granule_ur_pattern)
+
+
+@responses.activate
+def test_find_in_cmr():
+    granule_urs = [
+        'OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_20250813T235131Z_S1A_30_v1.0',
+        'OPERA_L2_RTC-S1_T169-362724-IW3_20230714T075543Z_20250209T102633Z_S1A_30_v1.0',
+        'OPERA_L2_RTC-S1_T154-329511-IW1_20211202T062842Z_20250703T003157Z_S1A_30_v1.0',
+    ]
+    responses.get(
+        'https://cmr.earthdata.nasa.gov/search/granules.json',
+        status=200,
+        match=[
+            responses.matchers.query_string_matcher(
+                'short_name=OPERA_L2_RTC-S1_V1'
+                '&granule_ur%5B%5D=OPERA_L2_RTC-S1_T075-160101-IW2_20250813T204041Z_%2AZ_S1A_30_v1.0'
+                '&granule_ur%5B%5D=OPERA_L2_RTC-S1_T169-362724-IW3_20230714T075543Z_%2AZ_S1A_30_v1.0'
+                '&options%5Bgranule_ur%5D%5Bpattern%5D=true'
+                '&page_size=2000'
+            ),
+        ],
+        json={
+            'feed': {
+                'entry': [
+                    {'title': 'OPERA_L2_RTC-S1_T169-362724-IW3_20230714T075543Z_20240101T000000Z_S1A_30_v1.0'},
+                    {'title': 'OPERA_L2_RTC-S1_T169-362724-IW3_20230714T075543Z_20250101T000000Z_S1A_30_v1.0'},
+                ],
+            },
+        },
+    )
+    responses.get(
+        'https://cmr.earthdata.nasa.gov/search/granules.json',
+        status=200,
+        match=[
+            responses.matchers.query_string_matcher(
+                'short_name=OPERA_L2_RTC-S1_V1'
+                '&granule_ur%5B%5D=OPERA_L2_RTC-S1_T154-329511-IW1_20211202T062842Z_%2AZ_S1A_30_v1.0'
+                '&options%5Bgranule_ur%5D%5Bpattern%5D=true'
+                '&page_size=2000'
+            ),
+        ],
+        json={
+            'feed': {
+                'entry': [
+                    {'title': 'OPERA_L2_RTC-S1_T154-329511-IW1_20211202T062842Z_20250101T000000Z_S1A_30_v1.0'},
+                ],
+            },
+        },
+    )
+
+    assert util.find_in_cmr(
+        'cmr.earthdata.nasa.gov', 'OPERA_L2_RTC-S1_V1', granule_urs, opera_rtc_s1_slc._granule_ur_pattern, batch_size=2
+    ) == {
+        granule_urs[0]: None,
+        granule_urs[1]: 'OPERA_L2_RTC-S1_T169-362724-IW3_20230714T075543Z_20240101T000000Z_S1A_30_v1.0',
+        granule_urs[2]: 'OPERA_L2_RTC-S1_T154-329511-IW1_20211202T062842Z_20250101T000000Z_S1A_30_v1.0',
+    }
+    assert len(responses.calls) == 2
+
+    assert (
+        util.find_in_cmr('cmr.earthdata.nasa.gov', 'OPERA_L2_RTC-S1_V1', [], opera_rtc_s1_slc._granule_ur_pattern) == {}
+    )
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_find_in_cmr_search_after(monkeypatch):
+    monkeypatch.setattr(util, 'CMR_PAGE_SIZE', 1)
+    responses.get(
+        'https://cmr.earthdata.nasa.gov/search/granules.json',
+        status=200,
+        match=[responses.matchers.header_matcher({'CMR-Search-After': '["a"]'})],
+        json={'feed': {'entry': [{'title': 'bar-2'}]}},
+    )
+    responses.get(
+        'https://cmr.earthdata.nasa.gov/search/granules.json',
+        status=200,
+        headers={'CMR-Search-After': '["a"]'},
+        json={'feed': {'entry': [{'title': 'foo-2'}]}},
+    )
+
+    assert util.find_in_cmr(
+        'cmr.earthdata.nasa.gov', 'myCollection', ['foo-1', 'bar-1', 'baz-1'], gunw._granule_ur_pattern
+    ) == {
+        'foo-1': 'foo-2',
+        'bar-1': 'bar-2',
+        'baz-1': None,
+    }
+
+
+def test_get_max_record_workers(monkeypatch):
+    assert util.get_max_record_workers() == 4
+
+    monkeypatch.setenv('MAX_RECORD_WORKERS', '8')
+    assert util.get_max_record_workers() == 8
+
+    util.get_cmr_session.cache_clear()
+    assert util.get_cmr_session().get_adapter('https://cmr.earthdata.nasa.gov')._pool_maxsize == 8  # type: ignore[attr-defined]
+    util.get_cmr_session.cache_clear()
+
+
+def test_create_boto3_client():
+    def create_client(service_name, **kwargs):
+        assert util.BOTO3_CLIENT_LOCK.locked()
+        return service_name, kwargs
+
+    with patch('boto3.client', side_effect=create_client) as mock_client:
+        assert util.create_boto3_client('sqs') == ('sqs', {})
+        assert util.create_boto3_client('s3', region_name='us-west-2') == ('s3', {'region_name': 'us-west-2'})
+        assert mock_client.call_count == 2
+    assert not util.BOTO3_CLIENT_LOCK.locked()